@@ -0,0 +1,216 @@
+"""Weekly per-user engagement metrics, computed with pandas and stored in engagement_weekly.
+
+Run `python analytics.py --bench` to time the computation against synthetic tables of
+increasing size.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+from db import (
+    ENGAGEMENT_COLUMNS, get_engagement_summary, get_latest_engagement_week,
+    get_top_engaged, iter_export_chunks, now_ts, replace_engagement_weeks
+)
+
+WEEK = 7 * 86400
+WEEK_OFFSET = 4 * 86400  # the epoch fell on a Thursday; weeks here start on Monday
+ANALYTICS_WEEKS = 2  # weeks recomputed by the scheduled job: the current and the previous one
+CHUNK_ROWS = 50_000
+PAGE_ROWS = 250_000
+
+
+def week_start(ts):
+    """Monday 00:00 UTC of the week containing `ts` (scalar or array)."""
+    return (ts - WEEK_OFFSET) // WEEK * WEEK + WEEK_OFFSET
+
+
+def _chunks(table: str, columns, since: int = None):
+    """`columns` of the table as DataFrames of up to CHUNK_ROWS rows, each tagged with its week.
+
+    Only the columns a metric needs are read: building frames from row tuples is the slow part.
+    """
+    columns = ["id", *columns, "created_at"]
+    for rows in iter_export_chunks(table, since, page_size=PAGE_ROWS, chunk_size=CHUNK_ROWS,
+                                   columns=columns):
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        frame["week_start"] = week_start(frame["created_at"].to_numpy(dtype=np.int64))
+        yield frame
+
+
+def _count(frame, user_column, name, mask=None):
+    if mask is not None:
+        frame = frame[mask]
+    return frame.groupby(["week_start", user_column]).size().rename(name).rename_axis(
+        ["week_start", "telegram_id"])
+
+
+def _partials(since: int = None):
+    """Per-chunk aggregates; each is small, so only these are held while the tables stream."""
+    for frame in _chunks("completions", ["telegram_id"], since):
+        yield _count(frame, "telegram_id", "raids_done").to_frame()
+
+    for frame in _chunks("verifications", ["doer_id", "owner_id", "status"], since):
+        status = frame["status"].to_numpy()
+        yield pd.concat([
+            _count(frame, "owner_id", "raids_received"),
+            _count(frame, "doer_id", "raids_confirmed", status == "confirmed"),
+            _count(frame, "doer_id", "raids_rejected", status == "rejected"),
+        ], axis=1)
+
+    for frame in _chunks("follow_actions", ["follower_id", "confirmed"], since):
+        yield pd.concat([
+            _count(frame, "follower_id", "follows_given"),
+            _count(frame, "follower_id", "follow_backs", frame["confirmed"].to_numpy() == 1),
+        ], axis=1)
+
+    for frame in _chunks("slot_logs", ["telegram_id", "slots"], since):
+        slots = frame["slots"].to_numpy(dtype=np.float64)
+        frame["slots_earned"] = np.where(slots > 0, slots, 0.0)
+        frame["slots_spent"] = np.where(slots < 0, -slots, 0.0)
+        yield frame.groupby(["week_start", "telegram_id"])[["slots_earned", "slots_spent"]].sum()
+
+
+def compute_engagement(since: int = None, now: int = None) -> pd.DataFrame:
+    """One row per (week_start, telegram_id) with every ENGAGEMENT_COLUMNS metric."""
+    now = now_ts() if now is None else now
+    partials = [p for p in _partials(since) if len(p)]
+    if not partials:
+        return pd.DataFrame(columns=["week_start", "telegram_id", *ENGAGEMENT_COLUMNS])
+
+    # Users can appear in several chunks of the same table, so partials are summed, not joined
+    totals = pd.concat(partials).groupby(level=["week_start", "telegram_id"]).sum(min_count=1)
+    totals = totals.reindex(columns=[c for c in ENGAGEMENT_COLUMNS if c not in
+                                     ("confirmation_rate", "reciprocity", "slot_velocity")])
+    totals = totals.fillna(0)
+
+    settled = totals["raids_confirmed"] + totals["raids_rejected"]
+    totals["confirmation_rate"] = (totals["raids_confirmed"] / settled).where(settled > 0)
+    totals["reciprocity"] = (totals["follow_backs"] / totals["follows_given"]).where(
+        totals["follows_given"] > 0)
+    # The current week is only partly over, so its velocity uses the days elapsed so far
+    weeks = totals.index.get_level_values("week_start").to_numpy(dtype=np.int64)
+    days = np.clip((now - weeks) / 86400, 1.0, 7.0)
+    totals["slot_velocity"] = np.round(totals["slots_earned"].to_numpy() / days, 3)
+
+    int_columns = ["raids_done", "raids_received", "raids_confirmed", "raids_rejected",
+                   "follows_given", "follow_backs"]
+    totals[int_columns] = totals[int_columns].astype(np.int64)
+    return totals[list(ENGAGEMENT_COLUMNS)].reset_index()
+
+
+def refresh_engagement(weeks: int | None = ANALYTICS_WEEKS) -> int:
+    """Recompute the last `weeks` weeks (all history if None); returns rows written."""
+    since_week = 0 if weeks is None else int(week_start(now_ts())) - (weeks - 1) * WEEK
+    frame = compute_engagement(since_week or None)
+    records = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+    return replace_engagement_weeks(since_week, records)
+
+
+def format_report(week: int = None) -> str:
+    week = get_latest_engagement_week() if week is None else week
+    if week is None:
+        return "📈 No engagement data yet. Use /analytics refresh to compute it."
+    summary = get_engagement_summary(week)
+    settled = summary["raids_confirmed"] + summary["raids_rejected"]
+    rate = f"{summary['raids_confirmed'] / settled:.0%}" if settled else "–"
+    reciprocity = f"{summary['follow_backs'] / summary['follows_given']:.0%}" if summary["follows_given"] else "–"
+    lines = [
+        f"📈 Engagement — week of {time.strftime('%Y-%m-%d', time.gmtime(week))}\n",
+        f"👥 Active users: {summary['users']}",
+        f"⚔️ Raids done: {summary['raids_done']} · ✅ confirmation rate: {rate}",
+        f"🤝 Follows: {summary['follows_given']} · followed back: {reciprocity}",
+        f"🎯 Slots: +{summary['slots_earned']:g} earned · -{summary['slots_spent']:g} spent",
+    ]
+    top = get_top_engaged(week)
+    if top:
+        lines.append("\n🏆 Most active raiders:")
+        for name, raids, confirmation, follow_rate, velocity in top:
+            lines.append(
+                f"• {name}: {raids} raid(s), "
+                f"{'–' if confirmation is None else f'{confirmation:.0%}'} confirmed, "
+                f"{velocity:g} slots/day"
+            )
+    computed = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(summary["computed_at"]))
+    lines.append(f"\n🕓 Computed {computed}")
+    return "\n".join(lines)
+
+
+# ───── Benchmark ─────────────────────────────────────────
+
+def _seed_synthetic(rows: int, users: int, span_days: int, rng):
+    """Fill the four source tables with `rows` rows each, spread over `span_days` days."""
+    now = now_ts()
+    created = now - rng.integers(0, span_days * 86400, rows)
+    actors = rng.integers(1, users + 1, rows)
+    others = rng.integers(1, users + 1, rows)
+    posts = rng.integers(1, max(rows // 20, 1) + 1, rows)
+    statuses = rng.choice(np.array(["pending", "confirmed", "rejected"]), rows, p=[0.2, 0.7, 0.1])
+    confirmed = rng.random(rows) < 0.6
+    slots = np.where(rng.random(rows) < 0.8, 0.1, -1.0)
+
+    # completions and follow_actions have unique keys, so those tables may come out a bit smaller
+    conn = db.connect()
+    conn.executemany(
+        "INSERT OR IGNORE INTO completions (telegram_id, post_id, created_at) VALUES (?, ?, ?)",
+        zip(actors.tolist(), posts.tolist(), created.tolist()))
+    conn.executemany(
+        "INSERT INTO verifications (post_id, doer_id, owner_id, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        zip(posts.tolist(), actors.tolist(), others.tolist(), statuses.tolist(), created.tolist(),
+            created.tolist()))
+    conn.executemany(
+        "INSERT OR IGNORE INTO follow_actions (follower_id, followed_id, confirmed, responded, created_at) "
+        "VALUES (?, ?, ?, 1, ?)",
+        zip(actors.tolist(), others.tolist(), confirmed.astype(int).tolist(), created.tolist()))
+    conn.executemany(
+        "INSERT INTO slot_logs (telegram_id, slots, reason, created_at) VALUES (?, ?, 'task', ?)",
+        zip(actors.tolist(), slots.tolist(), created.tolist()))
+    conn.commit()
+    conn.close()
+
+
+def bench(sizes, users: int, span_days: int):
+    rng = np.random.default_rng(0)
+    print(f"{'rows/table':>12} {'seconds':>9} {'rows/s':>12} {'user-weeks':>11}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db.configure_db(os.path.join(tmp_dir, "bench.db"))
+            db.init_db()
+            _seed_synthetic(size, users, span_days, rng)
+            started = time.perf_counter()
+            frame = compute_engagement()
+            elapsed = time.perf_counter() - started
+            print(f"{size:>12,} {elapsed:>9.2f} {4 * size / elapsed:>12,.0f} {len(frame):>11,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute weekly engagement metrics.")
+    parser.add_argument("--db", default=None, help="SQLite file to read (default: BOT_DB)")
+    parser.add_argument("--weeks", type=int, default=None,
+                        help="recompute only the last N weeks (default: all history)")
+    parser.add_argument("--bench", action="store_true",
+                        help="time the computation on synthetic tables instead")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="rows per table for --bench")
+    parser.add_argument("--users", type=int, default=5_000, help="distinct users for --bench")
+    parser.add_argument("--span-days", type=int, default=56, help="history length for --bench")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.sizes, args.users, args.span_days)
+        return
+    if args.db:
+        db.configure_db(args.db)
+    db.init_db()
+    written = refresh_engagement(args.weeks)
+    print(f"📈 Wrote {written} user-week row(s)")
+    print(format_report())
+
+
+if __name__ == "__main__":
+    main()
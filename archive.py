@@ -0,0 +1,51 @@
+import os
+import time
+
+from db import (
+    ARCHIVED_TABLES, archive_posts_batch, archive_slot_logs_batch, get_archive_cutoff,
+    get_archive_status, now_ts, refresh_hourly_rollups
+)
+
+# Leaderboard weeks, the ban sweep and the two weeks analytics refreshes all read hot rows
+# only, so nothing younger than this is ever archived whatever ARCHIVE_AFTER_DAYS says.
+MIN_ARCHIVE_DAYS = 15
+ARCHIVE_AFTER_DAYS = max(int(os.getenv("ARCHIVE_AFTER_DAYS", "30")), MIN_ARCHIVE_DAYS)
+ARCHIVE_BATCH_SIZE = 500  # posts (with their raids) or slot logs per transaction
+ARCHIVE_TIME_BUDGET = 60  # seconds one run may spend; the rest waits for the next run
+ARCHIVE_PAUSE = 0.05  # between batches, so the bot's own writes get the lock
+
+
+def run_archival(time_budget: float = ARCHIVE_TIME_BUDGET) -> dict:
+    """Move rows older than ARCHIVE_AFTER_DAYS to the archive in batches; returns counts moved."""
+    # Hourly rollups are computed from the hot tables, so bring them up to date first
+    refresh_hourly_rollups()
+    cutoff = now_ts() - ARCHIVE_AFTER_DAYS * 86400
+    deadline = time.monotonic() + time_budget
+    moved = {"posts": 0, "slot_logs": 0}
+    for name, batch in (("posts", archive_posts_batch), ("slot_logs", archive_slot_logs_batch)):
+        while time.monotonic() < deadline:
+            count = batch(cutoff, ARCHIVE_BATCH_SIZE)
+            moved[name] += count
+            if count < ARCHIVE_BATCH_SIZE:
+                break
+            time.sleep(ARCHIVE_PAUSE)
+    if any(moved.values()):
+        print(f"🗃️ Archived {moved['posts']} post(s) with their raids and {moved['slot_logs']} slot log(s).")
+    return moved
+
+
+def format_archive_status() -> str:
+    status = get_archive_status()
+    cutoff = get_archive_cutoff()
+    lines = [f"🗃️ Archive (rows older than {ARCHIVE_AFTER_DAYS} days)\n"]
+    for table in ARCHIVED_TABLES:
+        hot, archived = status[table]
+        lines.append(f"• {table}: {hot} hot · {archived} archived")
+    lines.append(
+        f"\n💾 Main DB: {status['main_bytes'] / 1e6:.1f} MB · archive: {status['archive_bytes'] / 1e6:.1f} MB"
+    )
+    if cutoff:
+        lines.append(f"🕓 Archived up to {time.strftime('%Y-%m-%d', time.gmtime(cutoff))}")
+    else:
+        lines.append("🕓 Nothing archived yet.")
+    return "\n".join(lines)
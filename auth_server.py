@@ -4,9 +4,9 @@ import requests
 import secrets
 import base64
 import hashlib
-import sqlite3
 from dotenv import load_dotenv
 from telegram import Bot
+from db import connect as db_connect, enqueue_notification, init_db, now_ts
 
 
 load_dotenv()
@@ -33,23 +33,30 @@ def generate_code_verifier_challenge():
 
 
 def save_tokens(telegram_id, handle, twitter_id, access_token, refresh_token):
-    conn = sqlite3.connect("bot_data.db")
+    conn = db_connect()  # the /twitter/connect view below is also called connect
     cur = conn.cursor()
 
     cur.execute("SELECT 1 FROM users WHERE telegram_id = ?",
                 (str(telegram_id),))
     exists = cur.fetchone()
 
+    now = now_ts()
     if exists:
         cur.execute("""
-            UPDATE users SET twitter_handle = ?, twitter_id = ?, access_token = ?, refresh_token = ?, last_updated = CURRENT_TIMESTAMP
+            UPDATE users SET twitter_handle = ?, twitter_id = ?, access_token = ?, refresh_token = ?, last_updated = ?
             WHERE telegram_id = ?
-        """, (handle, twitter_id, access_token, refresh_token, str(telegram_id)))
+        """, (handle, twitter_id, access_token, refresh_token, now, str(telegram_id)))
     else:
         cur.execute("""
-            INSERT INTO users (telegram_id, twitter_handle, twitter_id, access_token, refresh_token)
-            VALUES (?, ?, ?, ?, ?)
-        """, (str(telegram_id), handle, twitter_id, access_token, refresh_token))
+            INSERT INTO users (telegram_id, twitter_handle, twitter_id, access_token, refresh_token, created_at, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (str(telegram_id), handle, twitter_id, access_token, refresh_token, now, now))
+
+    # Delivered by the bot's outbox drainer once this transaction commits
+    enqueue_notification(
+        conn, int(telegram_id),
+        f"✅ Your Twitter account (@{handle}) has been connected successfully!"
+    )
 
     conn.commit()
     conn.close()
@@ -123,21 +130,10 @@ def callback():
         if not twitter_handle:
             return "❌ Failed to retrieve user info", 500
 
-        # ✅ Save to DB
+        # ✅ Save to DB (also queues the Telegram confirmation)
         save_tokens(telegram_id, twitter_handle, twitter_id,
                     access_token, refresh_token)
 
-        try:
-            message = f"✅ Your Twitter account (@{twitter_handle}) has been connected successfully!"
-            telegram_api_url = f"https://api.telegram.org/bot{API_KEY}/sendMessage"
-            payload = {
-                "chat_id": telegram_id,
-                "text": message
-            }
-            requests.post(telegram_api_url, data=payload)
-        except Exception as e:
-            print(f"❌ Failed to send Telegram message: {e}")
-
         return "✅ Twitter connected successfully, you can close this page!"
 
     except Exception as e:
@@ -146,4 +142,5 @@ def callback():
 
 
 if __name__ == "__main__":
+    init_db()
     app.run(host="0.0.0.0", port=8080)
@@ -1,13 +1,16 @@
 import os
 import re
+import asyncio
 import html
 import pytz
 import logging
+import tempfile
 import threading
 from auth_server import app as flask_app
 from pytz import timezone
 from datetime import datetime, timedelta, timezone as dt_timezone
 from functools import partial
+from itertools import chain
 
 # Telegram Core
 from telegram import (
@@ -15,12 +18,13 @@ from telegram import (
     ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
 )
 from telegram.constants import ChatType, ParseMode
+from telegram.error import BadRequest
 from telegram.helpers import escape_markdown
 
 # Telegram Extensions
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ContextTypes, filters, JobQueue
+    CallbackQueryHandler, ContextTypes, filters, JobQueue, TypeHandler
 )
 
 # APScheduler
@@ -33,16 +37,41 @@ from dotenv import load_dotenv
 
 # Internal Database Methods
 from db import (
-    get_recent_approved_posts, get_user_stats, add_user, get_user, get_user_slots,
-    save_post, get_pending_posts, set_post_status, deduct_slot_by_admin, expire_old_posts,
+    get_user_stats, add_user, get_user, get_user_slots,
+    save_post, get_pending_posts, expire_old_posts,
     set_twitter_handle, get_post_link_by_id, has_completed_post, mark_post_completed,
-    add_task_slot, ban_unresponsive_post_owners, is_user_banned, create_verification,
+    ban_unresponsive_post_owners, is_user_banned, create_verification,
     get_post_owner_id, close_verification, auto_approve_stale_posts, is_in_cooldown,
-    get_user_active_posts, get_verifications_for_post, update_last_post_time,
-    is_in_follow_pool, join_follow_pool, leave_follow_pool, get_follow_suggestions,
+    get_user_active_posts, get_verifications_for_post, iter_verifications_for_post, update_last_post_time,
+    is_in_follow_pool, join_follow_pool, leave_follow_pool, iter_follow_suggestions,
     create_follow_action, get_twitter_handle, confirm_follow_back, ignore_follow,
-    count_follow_backs, count_followers
+    count_follow_backs, count_followers, get_pending_followers, init_db, backup_db, now_ts,
+    get_pending_posts_page, get_pending_post_ids, get_pending_count, bulk_moderate_posts,
+    settle_pending_verifications, RAID_REWARD, confirm_verification, purge_sent_notifications,
+    create_broadcast, get_broadcast, cancel_broadcast, set_digest_mode, get_digest_prefs, flush_digest,
+    is_valid_tweet_link, parse_tweet_link, get_referral_depth_counts, get_referral_subtree_size,
+    get_top_referral_trees, get_user_names
 )
+from analytics import ANALYTICS_WEEKS, format_report, refresh_engagement
+from archive import format_archive_status, run_archival
+from broadcast import format_progress, resume_broadcasts, run_broadcast
+from dashboard import get_dashboard, rollup_job
+from digest import (
+    DEFAULT_DIGEST_INTERVAL, DIGEST_MAX_EVENTS, MAX_DIGEST_INTERVAL, digest_job, queue_digest_event,
+    render_digest
+)
+from dispatcher import KeyedUpdateProcessor
+from export import EXPORT_TABLES, MAX_UPLOAD_BYTES, export_table, parse_day
+from flow_state import Flow, flows, persist_flow_state
+from leaderboard import leaderboards
+from maintenance import (
+    MAINTENANCE_INTERVAL, enable_vacuum_now, format_storage_report, maintenance_job, note_activity,
+    run_maintenance
+)
+from ranking import feed
+from middleware import RateLimiter, idempotent_callback
+from notify import clear_unreachable_on_activity, fan_out, outbox_job, safe_send
+from recorder import UpdateRecorder
 
 
 # Configure logging
@@ -62,6 +91,8 @@ SUPPORT_URL = "https://t.me/web3kaijun"
 ADMINS = [6229232611]  # Telegram IDs of admins
 GROUP_ID = -1002828603829
 OAUTH_URL = "https://damilare-production-13b0.up.railway.app/twitter/connect"
+MODERATION_PAGE_SIZE = 8
+RECORD_FILE = os.getenv("UPDATE_RECORD_FILE")  # JSONL path; unset disables recording
 
 
 # ──────────────────────── UTILITIES ─────────────────────────
@@ -89,6 +120,34 @@ def run_background_jobs():
 
     )
 
+    scheduler.add_job(
+        purge_sent_notifications,
+        "interval",
+        hours=24,
+        next_run_time=datetime.now(dt_timezone.utc) + timedelta(minutes=5)
+    )
+
+    scheduler.add_job(
+        maintenance_job,
+        "interval",
+        seconds=MAINTENANCE_INTERVAL,
+        next_run_time=datetime.now(dt_timezone.utc) + timedelta(minutes=10)
+    )
+
+    scheduler.add_job(
+        run_archival,
+        "interval",
+        hours=24,
+        next_run_time=datetime.now(dt_timezone.utc) + timedelta(minutes=15)
+    )
+
+    scheduler.add_job(
+        refresh_engagement,
+        "interval",
+        hours=6,
+        next_run_time=datetime.now(dt_timezone.utc) + timedelta(minutes=7)
+    )
+
     scheduler.add_job(
         partial(auto_approve_stale_posts),
         "interval",
@@ -109,24 +168,9 @@ def run_background_jobs():
     logger.info("🕒 Background jobs started.")
 
 
-def extract_tweet_id(url: str) -> str | None:
-    """
-    Extract tweet ID from a Twitter or X.com link.
-    Supports both twitter.com and x.com formats.
-    """
-    match = re.search(r"(twitter\.com|x\.com)/\w+/status/(\d+)", url)
-    if match:
-        return match.group(2)
-    return None
-
 # Main menu keyboard
 
 
-def is_valid_tweet_link(url: str) -> bool:
-    """Check if a URL is a valid Twitter/X status link"""
-    return bool(re.search(r"(twitter\.com|x\.com)/\w+/status/\d+", url))
-
-
 def main_kbd(user_id: int | None = None) -> ReplyKeyboardMarkup:
     """Main keyboard layout"""
     keyboard = [
@@ -186,6 +230,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Register the user
     added = add_user(user.id, user.full_name, ref_by)
+    if added and ref_by:
+        leaderboards.record_referral(ref_by)
 
     # Welcome message
     welcome = (
@@ -233,7 +279,15 @@ async def review_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]])
         await update.message.reply_text(f"👤 {name}\n🔗 {link}", reply_markup=kb)
 
+    await update.message.reply_text(
+        "🗂 Many posts waiting? Use bulk moderation:",
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("🗂 Bulk Moderation", callback_data="bulk|page|0")
+        ]])
+    )
+
 
+@idempotent_callback
 async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle admin approval/rejection"""
     query = update.callback_query
@@ -242,18 +296,194 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     action, post_id, user_id = query.data.split("|")
     post_id, user_id = int(post_id), int(user_id)
 
+    # Transitions only apply to posts that are still pending, so a repeat tap is a no-op
     if action == "approve":
-        if deduct_slot_by_admin(user_id):
-            set_post_status(post_id, "approved")
-            await context.bot.send_message(user_id, "✅ Your post has been approved for raiding! 🚀")
+        approved, _, skipped = bulk_moderate_posts(approve_ids=[post_id])
+        if approved:
+            feed.invalidate()
+            await safe_send(context.bot, user_id, "✅ Your post has been approved for raiding! 🚀")
             await query.edit_message_text("✅ Post approved and 1 slot deducted.")
-        else:
-            set_post_status(post_id, "rejected")
+        elif skipped:
+            bulk_moderate_posts(reject_ids=[post_id])
             await query.edit_message_text("❌ Rejected: user has no available slots.")
+        else:
+            await query.edit_message_text("ℹ️ This post was already reviewed.")
     else:
-        set_post_status(post_id, "rejected")
-        await context.bot.send_message(user_id, "❌ Your post has been rejected.")
-        await query.edit_message_text("❌ Post rejected.")
+        _, rejected, _ = bulk_moderate_posts(reject_ids=[post_id])
+        if rejected:
+            await safe_send(context.bot, user_id, "❌ Your post has been rejected.")
+            await query.edit_message_text("❌ Post rejected.")
+        else:
+            await query.edit_message_text("ℹ️ This post was already reviewed.")
+
+
+def render_moderation_queue(page: int, selected: set[int]):
+    """Text and checkbox keyboard for one page of the bulk moderation queue."""
+    posts = get_pending_posts_page(page, MODERATION_PAGE_SIZE)
+    total = get_pending_count()
+    pages = max(1, -(-total // MODERATION_PAGE_SIZE))
+
+    if not posts:
+        return "✅ No pending posts.", None
+
+    lines = [f"🗂 <b>Moderation queue</b> — {total} pending (page {page + 1}/{pages})\n"]
+    rows = []
+    for post_id, link, name, tg_id, slots in posts:
+        slot_note = "" if slots > 0 else " ⚠️ no slots"
+        lines.append(
+            f"#{post_id} 👤 {html.escape(name or str(tg_id))} ({slots:g} slots){slot_note}\n"
+            f"🔗 {html.escape(link)}"
+        )
+        mark = "☑️" if post_id in selected else "⬜"
+        rows.append([InlineKeyboardButton(
+            f"{mark} #{post_id} {name or tg_id}"[:60], callback_data=f"bulk|toggle|{post_id}|{page}")])
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"bulk|page|{page - 1}"))
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"bulk|page|{page + 1}"))
+    if nav:
+        rows.append(nav)
+
+    rows.append([
+        InlineKeyboardButton(f"✅ Approve selected ({len(selected)})", callback_data=f"bulk|approve|{page}"),
+        InlineKeyboardButton(f"❌ Reject selected ({len(selected)})", callback_data=f"bulk|reject|{page}")
+    ])
+    rows.append([InlineKeyboardButton("✅ Approve all eligible", callback_data=f"bulk|approve_all|{page}")])
+    return "\n\n".join(lines), InlineKeyboardMarkup(rows)
+
+
+async def moderate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Open the bulk moderation queue"""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    context.user_data["bulk_selected"] = set()
+    text, keyboard = render_moderation_queue(0, set())
+    await update.message.reply_text(
+        text, reply_markup=keyboard, parse_mode=ParseMode.HTML, disable_web_page_preview=True
+    )
+
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/digest on [minutes] | off — bundle raid and follow notifications into periodic summaries"""
+    user_id = update.effective_user.id
+    args = context.args or []
+
+    if args and args[0].lower() == "off":
+        set_digest_mode(user_id, None)
+        flush_digest(user_id, render_digest)  # deliver whatever is still buffered
+        await update.message.reply_text("🔔 Digest off. You'll get each notification as it happens.")
+        return
+
+    if args and args[0].lower() == "on":
+        minutes = int(args[1]) if len(args) > 1 and args[1].isdigit() else DEFAULT_DIGEST_INTERVAL // 60
+        interval = min(max(minutes, 5) * 60, MAX_DIGEST_INTERVAL)
+        set_digest_mode(user_id, interval, DIGEST_MAX_EVENTS)
+        await update.message.reply_text(
+            f"🗞 Digest on: raid and follow notifications arrive as one summary every "
+            f"{interval // 60} minutes, or sooner after {DIGEST_MAX_EVENTS} events."
+        )
+        return
+
+    prefs = get_digest_prefs(user_id)
+    status = f"on, every {prefs[0] // 60} minutes" if prefs else "off"
+    await update.message.reply_text(
+        f"🗞 Digest mode is {status}.\n\n"
+        "/digest on [minutes] — bundle notifications into one summary\n"
+        "/digest off — get each notification as it happens"
+    )
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <text> to DM every user; /broadcast status|cancel <id> to follow up"""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    parts = update.message.text.split(maxsplit=1)
+    args = parts[1].split() if len(parts) > 1 else []
+    if len(args) == 2 and args[0] in ("status", "cancel") and args[1].isdigit():
+        broadcast_id = int(args[1])
+        if args[0] == "cancel" and not cancel_broadcast(broadcast_id):
+            await update.message.reply_text("⚠️ No running broadcast with that ID.")
+            return
+        campaign = get_broadcast(broadcast_id)
+        await update.message.reply_text(format_progress(campaign) if campaign else "⚠️ Unknown broadcast.")
+        return
+    if not args:
+        await update.message.reply_text(
+            "📣 Usage:\n/broadcast <message> — send to every user\n"
+            "/broadcast status <id>\n/broadcast cancel <id>"
+        )
+        return
+
+    broadcast_id = create_broadcast(parts[1], update.effective_user.id)
+    context.application.create_task(run_broadcast(context.bot, broadcast_id))
+    await update.message.reply_text(
+        f"📣 Broadcast #{broadcast_id} started. Progress reports will follow here."
+    )
+
+
+async def bulk_moderation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle checkbox toggles, paging and batch actions in the moderation queue"""
+    query = update.callback_query
+    if query.from_user.id not in ADMINS:
+        await query.answer("⛔ You're not authorized.", show_alert=True)
+        return
+
+    parts = query.data.split("|")
+    action = parts[1]
+    selected = context.user_data.setdefault("bulk_selected", set())
+    page = int(parts[-1])
+
+    if action == "toggle":
+        post_id = int(parts[2])
+        selected.symmetric_difference_update({post_id})
+    elif action in ("approve", "reject", "approve_all"):
+        if action == "approve_all":
+            ids = get_pending_post_ids()
+        else:
+            ids = sorted(selected)
+        if not ids:
+            await query.answer("Nothing selected.", show_alert=True)
+            return
+
+        if action == "reject":
+            approved, rejected, skipped = bulk_moderate_posts(reject_ids=ids)
+        else:
+            approved, rejected, skipped = bulk_moderate_posts(approve_ids=ids)
+        selected.clear()
+        if approved:
+            feed.invalidate()
+
+        messages = [
+            (owner_id, f"✅ Your post has been approved for raiding! 🚀\n🔗 {link}")
+            for _, owner_id, link in approved
+        ] + [
+            (owner_id, f"❌ Your post has been rejected.\n🔗 {link}")
+            for _, owner_id, link in rejected
+        ]
+        context.application.create_task(fan_out(context.bot, messages))
+
+        summary = f"✅ {len(approved)} approved, ❌ {len(rejected)} rejected"
+        if skipped:
+            summary += f", ⚠️ {len(skipped)} left pending (no slots)"
+        await query.answer(summary, show_alert=True)
+        page = 0
+
+    else:
+        await query.answer()
+
+    text, keyboard = render_moderation_queue(page, selected)
+    try:
+        await query.edit_message_text(
+            text, reply_markup=keyboard, parse_mode=ParseMode.HTML, disable_web_page_preview=True
+        )
+    except BadRequest:
+        pass  # Message unchanged
 
 
 async def connect_twitter(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -275,6 +505,7 @@ async def connect_twitter(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ──────────────────────── CALLBACK HANDLERS ─────────────────
 
 
+@idempotent_callback
 async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle all callback button presses"""
     query = update.callback_query
@@ -297,27 +528,26 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
                 text="🔘 You're now connected! Choose an option:",
                 reply_markup=main_kbd(user.id)
             )
-            context.user_data.pop("awaiting_twitter", None)  # Clean up state
+            flows.clear(user.id, Flow.AWAITING_TWITTER)  # Clean up state
         else:
             await query.edit_message_text(
                 f"❌ The handle @`{handle}` is already in use by another user.\n"
                 "Please send a different Twitter handle.",
                 parse_mode=ParseMode.MARKDOWN
             )
-            context.user_data["awaiting_twitter"] = True
+            flows.set(user.id, Flow.AWAITING_TWITTER)
 
     elif data.startswith("vconfirm|"):
         _, post_id_str, doer_id_str = data.split("|")
         post_id = int(post_id_str)
         doer_id = int(doer_id_str)
 
-        # Grant reward and close verification
-        add_task_slot(doer_id, 0.1)
-        close_verification(post_id, doer_id)
-        await context.bot.send_message(
-            chat_id=doer_id,
-            text="✅ Your raid was confirmed! You've earned 0.1 slots."
-        )
+        # Grant reward and close verification (only if still pending)
+        if not confirm_verification(post_id, doer_id):
+            await query.edit_message_text("ℹ️ This raid was already reviewed.")
+            return
+        leaderboards.record_raid_confirmed(doer_id, RAID_REWARD)
+        await safe_send(context.bot, doer_id, "✅ Your raid was confirmed! You've earned 0.1 slots.")
         await query.edit_message_text("🟢 You confirmed the raid as successful.")
 
     elif data.startswith("responses|"):
@@ -328,11 +558,10 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
         post_id = int(post_id_str)
         doer_id = int(doer_id_str)
 
-        close_verification(post_id, doer_id)
-        await context.bot.send_message(
-            chat_id=doer_id,
-            text="❌ Your raid was rejected by the post owner. No slots awarded."
-        )
+        if not close_verification(post_id, doer_id, "rejected"):
+            await query.edit_message_text("ℹ️ This raid was already reviewed.")
+            return
+        await safe_send(context.bot, doer_id, "❌ Your raid was rejected by the post owner. No slots awarded.")
         await query.edit_message_text("🔴 You rejected the raid.")
 
     elif data == "check_join":
@@ -350,7 +579,9 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
         follower_id = int(follower_id)
         followed_id = query.from_user.id
 
-        confirm_follow_back(followed_id, follower_id)
+        if not confirm_follow_back(followed_id, follower_id):
+            await query.edit_message_reply_markup(reply_markup=None)
+            return
 
         await query.answer("✅ Follow back recorded!")
 
@@ -358,12 +589,10 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
         followed_handle = get_twitter_handle(followed_id)
         followed_name = query.from_user.first_name
 
-        await context.bot.send_message(
-            chat_id=follower_id,
-            text=(
-                f"🎉 {followed_name} followed you back!\n\n"
-                f"🔗 View their profile: https://x.com/{followed_handle}"
-            )
+        await safe_send(
+            context.bot, follower_id,
+            f"🎉 {followed_name} followed you back!\n\n"
+            f"🔗 View their profile: https://x.com/{followed_handle}"
         )
 
         # Confirm to the one who followed back
@@ -376,18 +605,18 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
         _, follower_id = data.split("|")
         followed_id = query.from_user.id
 
-        ignore_follow(followed_id, int(follower_id))
+        if not ignore_follow(followed_id, int(follower_id)):
+            await query.edit_message_reply_markup(reply_markup=None)
+            return
 
         # Notify the follower
         handle = get_twitter_handle(followed_id)
         x_profile_url = f"https://x.com/{handle}"
 
-        await context.bot.send_message(
-            chat_id=int(follower_id),
-            text=(
-                f"❌ {handle} ignored your follow request.\n\n"
-                f"If you'd like, you can unfollow them here:\n\n [x.com/{handle}]({x_profile_url})"
-            ),
+        await safe_send(
+            context.bot, int(follower_id),
+            f"❌ {handle} ignored your follow request.\n\n"
+            f"If you'd like, you can unfollow them here:\n\n [x.com/{handle}]({x_profile_url})",
             parse_mode=ParseMode.MARKDOWN,
             disable_web_page_preview=True
         )
@@ -395,6 +624,9 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
         await query.answer("Ignored.")
         await query.edit_message_reply_markup(reply_markup=None)
 
+    elif data == "pendingfollowers":
+        await send_pending_followers(query.message, user.id)
+
     elif data.startswith("followdone|"):
         followed_id = int(data.split("|")[1])
         follower = query.from_user
@@ -404,19 +636,19 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
             await query.answer("You can't follow yourself!", show_alert=True)
             return
 
-        # Save follow action
-        create_follow_action(follower_id, followed_id)
+        # Save follow action; skip the notification if it was already recorded
+        if not create_follow_action(follower_id, followed_id):
+            await query.answer("✅ Already marked as followed.")
+            return
 
-        # Notify the followed user
+        # Notify the followed user, or add to their digest
         handle = get_twitter_handle(follower_id)
         name = follower.username or follower.first_name
-        try:
-            await context.bot.send_message(
-                chat_id=followed_id,
-                text=(
-                    f"👤 {name} says they followed you!\n\n"
-                    f"🔗 X Profile: https://x.com/{handle}"
-                ),
+        if not queue_digest_event(followed_id, "follow", follower_id, f"@{handle}" if handle else name):
+            await safe_send(
+                context.bot, followed_id,
+                f"👤 {name} says they followed you!\n\n"
+                f"🔗 X Profile: https://x.com/{handle}",
                 reply_markup=InlineKeyboardMarkup([
                     [
                         InlineKeyboardButton(
@@ -426,8 +658,6 @@ async def handle_callback_buttons(update: Update, context: ContextTypes.DEFAULT_
                     ]
                 ])
             )
-        except Exception as e:
-            print(f"❌ Couldn't notify user {followed_id}: {e}")
 
         # ✅ Edit original message to simple confirmation
         followed_user = get_user(followed_id)
@@ -457,8 +687,10 @@ async def handle_follow_for_follow(update: Update, context: ContextTypes.DEFAULT
         return
 
     if is_in_follow_pool(user.id):
-        suggestions = get_follow_suggestions(user.id)
-        if not suggestions:
+        # Streamed: the pool can be large and each suggestion is sent as it is read
+        suggestions = iter_follow_suggestions(user.id)
+        first = next(suggestions, None)
+        if first is None:
             await update.message.reply_text(
                 "📭 No users available to follow at the moment. Try again later!"
             )
@@ -470,10 +702,10 @@ async def handle_follow_for_follow(update: Update, context: ContextTypes.DEFAULT
             parse_mode=ParseMode.MARKDOWN
         )
 
-        for target in suggestions:
-            target_id = target["telegram_id"]
-            target_handle = target.get("twitter_handle", "")
-            target_name = target.get("name", "Unknown")
+        for target in chain([first], suggestions):
+            target_id = target.telegram_id
+            target_handle = target.twitter_handle or ""
+            target_name = target.name or "Unknown"
 
             # Get stats
             follow_count = count_followers(target_id)
@@ -510,7 +742,7 @@ async def handle_follow_for_follow(update: Update, context: ContextTypes.DEFAULT
         )
 
     else:
-        context.user_data["awaiting_f4f_join"] = True
+        flows.set(user.id, Flow.AWAITING_F4F_JOIN)
         await update.message.reply_text(
             "🤝 Join Follow for Follow pool?\n\n"
             "You'll be shown Twitter handles of others who also want to grow. "
@@ -531,11 +763,11 @@ async def handle_my_ongoing_raids(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("📭 You don’t have any active raids at the moment.")
         return
 
+    now = now_ts()
     for post in approved_posts:
-        post_id, post_link, approved_at = post
-        expires_at = datetime.fromisoformat(approved_at) + timedelta(hours=24)
-        time_left = expires_at - datetime.utcnow()
-        hours, minutes = divmod(int(time_left.total_seconds() // 60), 60)
+        post_id, post_link, expires_at = post
+        time_left = expires_at - now
+        hours, minutes = divmod(time_left // 60, 60)
 
         keyboard = InlineKeyboardMarkup([[
             InlineKeyboardButton("👥 View Responses",
@@ -572,15 +804,10 @@ async def handle_raid_participation(update: Update, context: ContextTypes.DEFAUL
 
     tweet_link = get_post_link_by_id(post_id)
 
-    if not tweet_link or not ("twitter.com" in tweet_link or "x.com" in tweet_link):
+    if not tweet_link or not parse_tweet_link(tweet_link):
         await query.edit_message_text("❌ Invalid tweet link. It must be from Twitter or X.")
         return
 
-    tweet_id = extract_tweet_id(tweet_link)
-    if not tweet_id:
-        await query.edit_message_text("❌ Unable to extract tweet ID. Make sure it's a full link.")
-        return
-
     post_owner = get_post_owner_id(post_id)
     if not post_owner:
         await query.edit_message_text("⚠️ Could not find the post owner.")
@@ -592,6 +819,7 @@ async def handle_raid_participation(update: Update, context: ContextTypes.DEFAUL
 
     # Mark the post as completed (pending confirmation)
     mark_post_completed(user.id, post_id)
+    feed.record_completion(post_id)
 
     # Create a verification entry for manual confirmation
     create_verification(post_id, user.id, post_owner)
@@ -601,12 +829,10 @@ async def handle_raid_participation(update: Update, context: ContextTypes.DEFAUL
         "Africa/Lagos")).strftime("%Y-%m-%d %I:%M %p")
     # Notify the post owner for approval
 
-    verifications = get_verifications_for_post(post_id)
-    status = None
-    for v in verifications:
-        if v[0] == user.id:  # v[0] = doer_id
-            status = v[3]    # v[3] = status (confirmed/rejected/pending)
-            break
+    # Stops reading at this raider's row instead of loading every response to the post
+    status = next(
+        (v.status for v in iter_verifications_for_post(post_id) if v.doer_id == user.id), None
+    )
 
     # Decide buttons
     buttons = []
@@ -618,18 +844,17 @@ async def handle_raid_participation(update: Update, context: ContextTypes.DEFAUL
                 "❌ Reject", callback_data=f"vreject|{post_id}|{user.id}")
         ]]
 
-    await context.bot.send_message(
-        chat_id=post_owner,
-        text=(
+    if not queue_digest_event(post_owner, "raid", user.id, user.username or user.full_name, post_id):
+        await safe_send(
+            context.bot, post_owner,
             f"📣 {user.username or user.full_name} says they've completed your raid:\n"
             f"🔗 {tweet_link}\n"
             f"🐦 Twitter: @{twitter_handle}\n\n"
             f"🕒 Submitted: {timestamp}\n\n"
             f"🕒 Submitted: {naija_time} (Nigerian Time)\n\n"
-            f"{'Do you confirm this?' if buttons else '✅ Already reviewed.'}"
-        ),
-        reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
-    )
+            f"{'Do you confirm this?' if buttons else '✅ Already reviewed.'}",
+            reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
+        )
 
     await query.edit_message_text("✅ Raid submitted. Waiting for the post owner to confirm.")
 
@@ -644,6 +869,19 @@ async def handle_view_responses(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text("📭 No responses for this raid yet.")
         return
 
+    pending = sum(1 for v in verifications if v[3] == "pending")
+    if pending > 1:
+        # Popular raids: settle everything at once instead of one tap per raider
+        await query.message.reply_text(
+            f"👥 {len(verifications)} response(s), {pending} pending review.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton(
+                    f"✅ Confirm all ({pending})", callback_data=f"vall|confirmed|{post_id}"),
+                InlineKeyboardButton(
+                    "❌ Reject all", callback_data=f"vall|rejected|{post_id}")
+            ]])
+        )
+
     for v in verifications:
         doer_id, raider_username, raider_handle, status = v
         name = f"{raider_username}\n\n" if raider_username else f"User {doer_id}"
@@ -664,6 +902,36 @@ async def handle_view_responses(update: Update, context: ContextTypes.DEFAULT_TY
         await query.message.reply_text(label, reply_markup=keyboard)
 
 
+async def handle_settle_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Confirm or reject every pending raid on one of the owner's posts"""
+    query = update.callback_query
+    _, status, post_id_str = query.data.split("|")
+    if status not in ("confirmed", "rejected"):
+        await query.answer()
+        return
+    post_id = int(post_id_str)
+    owner_id = query.from_user.id
+
+    if get_post_owner_id(post_id) != owner_id:
+        await query.answer("⛔ This isn't your raid.", show_alert=True)
+        return
+
+    doers = settle_pending_verifications(post_id, owner_id, status)
+    await query.answer()
+
+    if status == "confirmed":
+        for doer_id in doers:
+            leaderboards.record_raid_confirmed(doer_id, RAID_REWARD)
+        text = f"✅ Your raid was confirmed! You've earned {RAID_REWARD:g} slots."
+        summary = f"🟢 Confirmed {len(doers)} raid(s)."
+    else:
+        text = "❌ Your raid was rejected by the post owner. No slots awarded."
+        summary = f"🔴 Rejected {len(doers)} raid(s)."
+    context.application.create_task(fan_out(context.bot, [(doer_id, text) for doer_id in doers]))
+
+    await query.edit_message_text(summary if doers else "✅ Nothing left to review.")
+
+
 # ────────────────────────── MESSAGE HANDLERS ─────────────────
 
 
@@ -692,7 +960,7 @@ async def handle_message_buttons(update: Update, context: ContextTypes.DEFAULT_T
             return
 
         join_follow_pool(user.id, user_data["twitter_handle"])
-        context.user_data["awaiting_f4f_join"] = False
+        flows.clear(user.id, Flow.AWAITING_F4F_JOIN)
         await update.message.reply_text(
             "🎉 You’ve joined the Follow for Follow pool!",
             reply_markup=main_kbd(user.id)
@@ -712,7 +980,7 @@ async def handle_message_buttons(update: Update, context: ContextTypes.DEFAULT_T
         await handle_slots(update, context)
 
     elif txt == "📤 Post":
-        context.user_data["awaiting_post"] = True
+        flows.set(user.id, Flow.AWAITING_POST)
         await update.message.reply_text(
             "📤 *Submit your Twitter/X post link for review:*\n\n"
             "🔗 Please paste a *valid Twitter (twitter.com) or X (x.com) post link* below.\n"
@@ -736,36 +1004,23 @@ async def handle_message_buttons(update: Update, context: ContextTypes.DEFAULT_T
     elif txt == "🚫 Cancel":
         await handle_cancel(update, context)
 
-    elif context.user_data.get("awaiting_post"):
+    elif flows.has(user.id, Flow.AWAITING_POST):
         await handle_post_submission(update, context)
 
     elif txt == "👤 Profile":
         await handle_profile(update, context)
 
     elif txt == "📊 Stats":
-        await handle_stats_backup(update, context)
+        await handle_dashboard(update, context)
 
     elif txt == "📊 My Ongoing Raids":
         await handle_my_ongoing_raids(update, context)
 
     elif txt == "📥 Pending Followers":
-        pending = get_pending_followers(user.id)
-        if not pending:
-            await update.message.reply_text("📭 No one has followed you recently.")
-        else:
-            for follower_id, name, handle in pending:
-                await update.message.reply_text(
-                    f"👤 @{handle or name} followed you.\nClick below to respond.",
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton(
-                            "🔁 Follow Back", callback_data=f"followback|{follower_id}"),
-                        InlineKeyboardButton(
-                            "🚫 Ignore", callback_data=f"ignorefollow|{follower_id}")
-                    ]])
-                )
+        await send_pending_followers(update.message, user.id)
 
     else:
-        context.user_data["awaiting_post"] = False  # optional cleanup
+        flows.clear(user.id, Flow.AWAITING_POST)  # optional cleanup
         await update.message.reply_text(
             "❓ I didn't understand that. Choose an option:",
             reply_markup=main_kbd(user.id)
@@ -774,6 +1029,24 @@ async def handle_message_buttons(update: Update, context: ContextTypes.DEFAULT_T
 
 # ──────────────────────── HANDLER HELPERS ────────────────────
 
+async def send_pending_followers(message, user_id: int):
+    """Reply with one Follow Back / Ignore prompt per pending follower"""
+    pending = get_pending_followers(user_id)
+    if not pending:
+        await message.reply_text("📭 No one has followed you recently.")
+        return
+    for follower_id, name, handle in pending:
+        await message.reply_text(
+            f"👤 @{handle or name} followed you.\nClick below to respond.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton(
+                    "🔁 Follow Back", callback_data=f"followback|{follower_id}"),
+                InlineKeyboardButton(
+                    "🚫 Ignore", callback_data=f"ignorefollow|{follower_id}")
+            ]])
+        )
+
+
 async def handle_ongoing_raids(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle ongoing raids display"""
     user = update.effective_user
@@ -814,40 +1087,28 @@ async def handle_ongoing_raids(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # Continue with showing raids
     group_id = chat.id if chat.type in ("group", "supergroup") else None
-    posts = get_recent_approved_posts(group_id=group_id, with_time=True)
+    # Personalised top raids: least-raided and soonest-expiring first, joined ones left out
+    raids = feed.top_for(user.id, group_id=group_id)
 
-    if not posts:
-        await update.message.reply_text("🚫 No active raids in the last 24 hours.")
+    if not raids:
+        if feed.live_count(group_id):
+            await update.message.reply_text("🎉 You've joined every live raid. Check back soon!")
+        else:
+            await update.message.reply_text("🚫 No active raids in the last 24 hours.")
     else:
-        for post_id, post_link, name, approved_at_str in posts:
-            try:
-                approved_at = datetime.fromisoformat(approved_at_str)
-                if approved_at.tzinfo is None:
-                    approved_at = approved_at.replace(tzinfo=dt_timezone.utc)
-            except Exception:
-                await update.message.reply_text(f"⚠️ Skipping a post due to time error: {approved_at_str}")
-                continue
-
-            expires_at = approved_at + timedelta(hours=24)
-            now = datetime.now(dt_timezone.utc)
-            time_left = expires_at - now
-
-            if time_left.total_seconds() <= 0:
-                continue  # Skip expired
-
-            hours_left = int(time_left.total_seconds() // 3600)
-            minutes_left = int((time_left.total_seconds() % 3600) // 60)
+        now = now_ts()
+        for raid in raids:
+            post_id, post_link, name = raid.post_id, raid.link, raid.owner_name
+            time_left = max(0, raid.expires_at - now)
+            hours_left = time_left // 3600
+            minutes_left = (time_left % 3600) // 60
             time_left_str = f"{hours_left}h {minutes_left}m left"
 
-            if has_completed_post(user.id, post_id):
-                status = "✅ You’ve already joined this raid."
-                keyboard = None
-            else:
-                status = "❌ You haven’t joined this raid yet."
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton(
-                        "✅ Done", callback_data=f"done|{post_id}")]
-                ])
+            status = "❌ You haven’t joined this raid yet."
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton(
+                    "✅ Done", callback_data=f"done|{post_id}")]
+            ])
 
             escaped_name = html.escape(name)
             escaped_link = html.escape(post_link)
@@ -949,10 +1210,16 @@ async def handle_post_submission(update: Update, context: ContextTypes.DEFAULT_T
     chat = update.effective_chat
     group_id = chat.id if chat.type in ("group", "supergroup") else None
     print("✅ About to save post")
-    save_post(user.id, text, group_id=group_id)
+    if not save_post(user.id, text, group_id=group_id):
+        flows.clear(user.id, Flow.AWAITING_POST)
+        await update.message.reply_text(
+            "⚠️ This tweet has already been submitted and is pending review or being raided.",
+            reply_markup=main_kbd(user.id),
+        )
+        return
     print("✅ Post saved")
     update_last_post_time(user.id)
-    context.user_data["awaiting_post"] = False
+    flows.clear(user.id, Flow.AWAITING_POST)
 
     # ✅ Notify user
     await update.message.reply_text(
@@ -963,18 +1230,15 @@ async def handle_post_submission(update: Update, context: ContextTypes.DEFAULT_T
     # 📢 Notify admins
     name = user.full_name
     for admin_id in ADMINS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"📬 New post submitted by *{name}*:\n{text}",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception as e:
-            print(f"[ADMIN NOTIFY ERROR] Admin ID: {admin_id} - {e}")
+        await safe_send(
+            context.bot, admin_id,
+            f"📬 New post submitted by *{name}*:\n{text}",
+            parse_mode=ParseMode.MARKDOWN
+        )
 
 
 async def post_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["awaiting_post"] = True
+    flows.set(update.effective_user.id, Flow.AWAITING_POST)
     await update.message.reply_text("📨 Please send the Twitter/X post link you'd like to submit.")
 
     # First-time call to /post or menu button
@@ -985,7 +1249,13 @@ async def post_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=cancel_kbd()
     )
-    context.user_data["awaiting_post"] = True
+
+
+async def handle_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin dashboard from the hourly rollups (cached for a minute)."""
+    if update.effective_user.id not in ADMINS:
+        return
+    await update.message.reply_text(get_dashboard())
 
 
 async def handle_stats_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -994,17 +1264,125 @@ async def handle_stats_backup(update: Update, context: ContextTypes.DEFAULT_TYPE
     if user.id not in ADMINS:
         return
 
-    db_path = "bot_data.db"  # or your actual DB file path
+    # Snapshot through the backup API so this works for any BOT_DB mode, in-memory included
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backup_path = os.path.join(tmp_dir, "bot_data_backup.db")
+        backup_db(backup_path)
+        with open(backup_path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename="bot_data_backup.db",
+                caption="📦 Here is the current bot_data.db backup.\nYou can restore it after redeploying.",
+            )
+
+
+async def analytics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/analytics [refresh|rebuild] — weekly engagement report from engagement_weekly."""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    action = context.args[0].lower() if context.args else None
+    if action in ("refresh", "rebuild"):
+        await update.message.reply_text("⏳ Computing engagement metrics…")
+        # refresh: the last two weeks (as the 6-hourly job does); rebuild: all history
+        weeks = None if action == "rebuild" else ANALYTICS_WEEKS
+        await asyncio.to_thread(refresh_engagement, weeks)
+    elif action:
+        await update.message.reply_text("Usage: /analytics [refresh|rebuild]")
+        return
+    await update.message.reply_text(format_report())
+
+
+async def archive_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/archive [run] — hot vs archived row counts; run moves old rows now."""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    action = context.args[0].lower() if context.args else None
+    if action == "run":
+        await update.message.reply_text("⏳ Archiving old rows…")
+        moved = await asyncio.to_thread(run_archival)
+        await update.message.reply_text(
+            f"✅ Moved {moved['posts']} post(s) with their raids and {moved['slot_logs']} slot log(s)."
+        )
+    elif action:
+        await update.message.reply_text("Usage: /archive [run]")
+        return
+    await update.message.reply_text(await asyncio.to_thread(format_archive_status))
+
+
+async def maintenance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/maintenance [run|vacuum] — storage report; run does a maintenance pass now."""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    action = context.args[0].lower() if context.args else None
+    results = None
+    if action == "run":
+        # Asked for explicitly, so treat it as a quiet period
+        results = await asyncio.to_thread(run_maintenance, quiet=True)
+    elif action == "vacuum":
+        await update.message.reply_text("⏳ Running a full VACUUM; the bot may pause until it finishes…")
+        await update.message.reply_text(f"✅ {await asyncio.to_thread(enable_vacuum_now)}")
+    elif action:
+        await update.message.reply_text("Usage: /maintenance [run|vacuum]")
+        return
+    await update.message.reply_text(await asyncio.to_thread(format_storage_report, results))
+
 
-    if not os.path.exists(db_path):
-        await update.message.reply_text("❌ Database file not found.")
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export <table> [YYYY-MM-DD [YYYY-MM-DD]] [csv|parquet] — stream a table to a file."""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
         return
 
-    await update.message.reply_document(
-        document=open(db_path, "rb"),
-        filename="bot_data_backup.db",
-        caption="📦 Here is the current bot_data.db backup.\nYou can restore it after redeploying.",
+    args = list(context.args)
+    usage = (
+        "Usage: /export <table> [from YYYY-MM-DD] [to YYYY-MM-DD] [csv|parquet]\n"
+        f"Tables: {', '.join(EXPORT_TABLES)}\n"
+        "The end date is exclusive; csv is gzip-compressed."
     )
+    if not args or args[0] not in EXPORT_TABLES:
+        await update.message.reply_text(usage)
+        return
+    table = args.pop(0)
+    fmt = "csv"
+    if args and args[-1] in ("csv", "parquet"):
+        fmt = args.pop()
+    try:
+        bounds = [parse_day(arg) for arg in args]
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    if len(bounds) > 2:
+        await update.message.reply_text(usage)
+        return
+    start = bounds[0] if bounds else None
+    end = bounds[1] if len(bounds) > 1 else None
+
+    await update.message.reply_text(f"⏳ Exporting {table}…")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            # Runs off the event loop: a large table takes a while to stream
+            path, rows = await asyncio.to_thread(export_table, tmp_dir, table, fmt, start, end)
+        except RuntimeError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+            await update.message.reply_text(
+                f"❌ The export of {rows} row(s) is over Telegram's 50 MB upload limit. "
+                "Narrow the date range and try again."
+            )
+            return
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=os.path.basename(path),
+                caption=f"📤 {table}: {rows} row(s)",
+            )
 
 
 async def handle_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1017,16 +1395,89 @@ async def handle_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     ref_link = f"https://t.me/{context.bot.username}?start={user.id}"
     ref1 = user_data["ref_count_l1"] if user_data else 0
+    levels = get_referral_depth_counts(user.id, max_depth=3)
+    tree_size = get_referral_subtree_size(user.id)
 
     await update.message.reply_text(
         "📨 *Referral Program*\n\n"
         "🎯 Invite others and earn *0.2 engagement slot* per referral!\n\n"
         f"🔗 Your referral link:\n`{ref_link}`\n\n"
-        f"📊 *Total Referrals:* {ref1}",
+        f"📊 *Total Referrals:* {ref1}\n"
+        f"🌱 Level 2: {levels.get(2, 0)} · Level 3: {levels.get(3, 0)}\n"
+        f"🌳 *Whole referral tree:* {tree_size}",
         parse_mode=ParseMode.MARKDOWN
     )
 
 
+LEADERBOARD_TITLES = {  # board: (title, unit, button label)
+    "raiders": ("⚔️ Top Raiders", "raids", "⚔️ Raiders"),
+    "earners": ("💰 Top Earners", "slots", "💰 Earners"),
+    "referrers": ("📨 Top Referrers", "referrals", "📨 Referrers"),
+}
+
+
+def render_leaderboard(name: str, period: str, user_id: int):
+    """Text and switcher keyboard for one leaderboard view."""
+    title, unit, _ = LEADERBOARD_TITLES[name]
+    top = leaderboards.top(name, period, 10)
+    names = get_user_names(user_id for user_id, _ in top)
+    lines = [f"{title} — {'last 7 days' if period == 'week' else 'all time'}\n"]
+    if not top:
+        lines.append("Nobody yet. Be the first!")
+    for rank, (entry_id, score) in enumerate(top, start=1):
+        lines.append(f"{rank}. {names.get(entry_id, entry_id)} — {score:g} {unit}")
+    mine = leaderboards.rank(name, period, user_id)
+    lines.append(f"\n🏅 You: #{mine[0]} with {mine[1]:g} {unit}" if mine else "\n🏅 You're not ranked yet.")
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(("• " if board == name else "") + label, callback_data=f"lb|{board}|{period}")
+         for board, (_, _, label) in LEADERBOARD_TITLES.items()],
+        [InlineKeyboardButton(("• " if p == period else "") + label, callback_data=f"lb|{name}|{p}")
+         for p, label in (("week", "7 days"), ("all", "All time"))],
+    ])
+    return "\n".join(lines), keyboard
+
+
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/leaderboard — top raiders, earners and referrers"""
+    text, keyboard = render_leaderboard("raiders", "week", update.effective_user.id)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switch leaderboard or period in place"""
+    query = update.callback_query
+    _, name, period = query.data.split("|")
+    await query.answer()
+    if name not in LEADERBOARD_TITLES or period not in ("week", "all"):
+        return
+    text, keyboard = render_leaderboard(name, period, query.from_user.id)
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except BadRequest:
+        pass  # same view tapped again: "message is not modified"
+
+
+async def referral_trees_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin view of the largest referral trees"""
+    if update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ You're not authorized.")
+        return
+
+    trees = get_top_referral_trees(10)
+    if not trees:
+        await update.message.reply_text("🌳 No referrals yet.")
+        return
+    lines = ["🌳 Top referral trees\n"]
+    for rank, (telegram_id, name, size) in enumerate(trees, start=1):
+        levels = get_referral_depth_counts(telegram_id, max_depth=3)
+        lines.append(
+            f"{rank}. {name or telegram_id} — {size} total "
+            f"(L1 {levels.get(1, 0)} · L2 {levels.get(2, 0)} · L3 {levels.get(3, 0)})"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+
 async def handle_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle support request"""
     await update.message.reply_text(
@@ -1084,7 +1535,11 @@ async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     tweet_url = post[2]
-    tweet_id = tweet_url.split("/")[-1]
+    parsed = parse_tweet_link(tweet_url)
+    if not parsed:
+        await query.edit_message_text("❗️This post's link is invalid.")
+        return
+    tweet_id = parsed[1]
 
     # Get user token from DB
     user = get_user(telegram_id)
@@ -1097,46 +1552,62 @@ async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle cancel action"""
-    context.user_data.pop("awaiting_post", None)
+    flows.clear(update.effective_user.id, Flow.AWAITING_POST)
     await update.message.reply_text("Back to main menu.", reply_markup=main_kbd(update.effective_user.id))
 
 
-def run_flask():
-    flask_app.run(host="0.0.0.0", port=8080)
+async def save_flow_state(app):
+    """Write any unsaved conversation state before exit so in-progress flows survive restarts."""
+    flows.flush()
 
-# ─────────────────────────── MAIN ────────────────────────────
 
+async def log_dispatcher_stats(context: ContextTypes.DEFAULT_TYPE):
+    stats = context.application.update_processor.stats()
+    if stats["waiting"] or stats["running"]:
+        logger.info(f"📬 Dispatcher: {stats}")
 
-def main():
-    """Start the bot"""
 
-    # Set timezone using pytz and convert with astimezone (required by APScheduler)
-    lagos_tz = pytz.timezone("Africa/Lagos")
+def run_flask():
+    flask_app.run(host="0.0.0.0", port=8080)
 
-    # Build the app first — don't pass job_queue manually
-    app = ApplicationBuilder().token(API_KEY).build()
+# ─────────────────────────── MAIN ────────────────────────────
 
-    # Configure the job queue scheduler explicitly
-    app.job_queue.scheduler.configure(timezone=astimezone(lagos_tz))
 
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.start()
+def register_handlers(app):
+    """Attach every command, callback and message handler to the application."""
+    if RECORD_FILE:
+        recorder = UpdateRecorder(RECORD_FILE, salt=os.getenv("UPDATE_RECORD_SALT"))
+        app.add_handler(TypeHandler(Update, recorder.handle), group=-100)
+        logger.info(f"📼 Recording incoming updates to {RECORD_FILE}")
 
-    # Run background tasks
-    run_background_jobs()
+    # Timestamps every update so maintenance only runs its heavier steps while the bot is idle
+    app.add_handler(TypeHandler(Update, note_activity), group=-3)
+
+    # Runs before every handler: per-user/per-command budgets and overload shedding
+    app.add_handler(TypeHandler(Update, clear_unreachable_on_activity), group=-2)
+    app.add_handler(TypeHandler(Update, RateLimiter(ADMINS).handle), group=-1)
 
-    # ─────────────── HANDLERS ───────────────
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("profile", handle_profile))
     app.add_handler(CommandHandler("slots", handle_slots))
     app.add_handler(CommandHandler("review", review_posts))
     app.add_handler(CommandHandler("post", handle_post_submission))
     app.add_handler(CommandHandler("referrals", handle_referrals))
+    app.add_handler(CommandHandler("referral_trees", referral_trees_command))
+    app.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    app.add_handler(CommandHandler("backup", handle_stats_backup))
+    app.add_handler(CommandHandler("export", export_command))
+    app.add_handler(CommandHandler("analytics", analytics_command))
+    app.add_handler(CommandHandler("archive", archive_command))
+    app.add_handler(CommandHandler("maintenance", maintenance_command))
     app.add_handler(CommandHandler("support", handle_support))
     app.add_handler(CommandHandler("contacts", handle_contacts))
     app.add_handler(CommandHandler("connect", connect_twitter))
     app.add_handler(CommandHandler("ongoing_raids", handle_ongoing_raids))
     app.add_handler(CommandHandler("my_raids", handle_my_ongoing_raids))
+    app.add_handler(CommandHandler("moderate", moderate_command))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
+    app.add_handler(CommandHandler("digest", digest_command))
 
     app.add_handler(CallbackQueryHandler(
         handle_callback_buttons, pattern=r"^(confirm_twitter|responses|vconfirm|vreject)\|"))
@@ -1144,6 +1615,12 @@ def main():
         handle_raid_participation, pattern=r"^done\|"))
     app.add_handler(CallbackQueryHandler(
         admin_callback, pattern=r"^(approve|reject)\|"))
+    app.add_handler(CallbackQueryHandler(
+        bulk_moderation_callback, pattern=r"^bulk\|"))
+    app.add_handler(CallbackQueryHandler(
+        handle_settle_all, pattern=r"^vall\|"))
+    app.add_handler(CallbackQueryHandler(
+        leaderboard_callback, pattern=r"^lb\|"))
     app.add_handler(CallbackQueryHandler(handle_callback_buttons))
 
     app.add_handler(MessageHandler(
@@ -1151,6 +1628,48 @@ def main():
         handle_message_buttons
     ))
 
+
+def build_application(token: str = API_KEY, base_url: str | None = None):
+    """Build the bot application. `base_url` points it at another Bot API server (e.g. the replay fake)."""
+    builder = (
+        ApplicationBuilder().token(token)
+        .concurrent_updates(KeyedUpdateProcessor())
+        .post_shutdown(save_flow_state)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
+    register_handlers(app)
+    return app
+
+
+def main():
+    """Start the bot"""
+
+    # Set timezone using pytz and convert with astimezone (required by APScheduler)
+    lagos_tz = pytz.timezone("Africa/Lagos")
+
+    init_db()
+    leaderboards.rebuild()
+
+    # Build the app first — don't pass job_queue manually
+    app = build_application()
+
+    # Configure the job queue scheduler explicitly
+    app.job_queue.scheduler.configure(timezone=astimezone(lagos_tz))
+
+    flask_thread = threading.Thread(target=run_flask)
+    flask_thread.start()
+
+    # Run background tasks
+    run_background_jobs()
+    app.job_queue.run_repeating(log_dispatcher_stats, interval=60, first=60)
+    app.job_queue.run_repeating(persist_flow_state, interval=5, first=5)
+    app.job_queue.run_repeating(outbox_job, interval=2, first=1)
+    app.job_queue.run_once(resume_broadcasts, when=10)
+    app.job_queue.run_repeating(digest_job, interval=60, first=30)
+    app.job_queue.run_repeating(rollup_job, interval=300, first=20)
+
     logger.info("🤖 Bot is running...")
     app.run_polling()
 
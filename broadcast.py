@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from db import checkpoint_broadcast, get_broadcast, get_running_broadcast_ids, get_user_ids_after
+from notify import is_unreachable, note_send_error, retry_delay
+
+# Leaves headroom under Telegram's ~30 msg/s for interactive replies and the outbox
+BROADCAST_PER_SECOND = 20
+BROADCAST_CONCURRENCY = 8  # sends in flight at once; hides API latency without bursting
+BROADCAST_PAGE_SIZE = 200  # recipients per keyset page, and per checkpoint
+PROGRESS_INTERVAL = 60  # seconds between progress reports to the campaign's admin
+
+_active = {}  # broadcast_id -> (monotonic start, messages handled in this run)
+
+
+class RatePacer:
+    """Hands out send slots at least 1/per_second apart, shared by concurrent senders."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1 / per_second
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Flood control: push every later slot back by `seconds`."""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+async def _send(bot, pacer: RatePacer, slots: asyncio.Semaphore, chat_id: int, text: str,
+                parse_mode: str | None) -> bool:
+    if is_unreachable(chat_id):
+        return False
+    async with slots:
+        for attempt in range(2):
+            await pacer.wait()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return True
+            except RetryAfter as e:
+                pacer.pause(retry_delay(e))
+            except Exception as e:
+                note_send_error(chat_id, e)
+                return False
+        return False
+
+
+def format_progress(campaign) -> str:
+    broadcast_id, _, _, _, status, _, total, sent, failed, _ = campaign
+    done = sent + failed
+    line = f"📣 Broadcast #{broadcast_id} ({status}): {sent}/{total} sent, {failed} failed"
+    if broadcast_id in _active and status == "running":
+        started, handled = _active[broadcast_id]
+        rate = handled / max(time.monotonic() - started, 1e-6)
+        if rate > 0:
+            eta = max(total - done, 0) / rate
+            line += f"\n⚡ {rate:.1f} msg/s · ETA {int(eta // 60)}m {int(eta % 60)}s"
+    return line
+
+
+async def _report(bot, campaign):
+    if campaign and campaign[3]:
+        try:
+            await bot.send_message(chat_id=campaign[3], text=format_progress(campaign))
+        except Exception as e:
+            print(f"❌ Failed to send broadcast progress: {e}")
+
+
+async def run_broadcast(bot, broadcast_id: int, per_second: float = BROADCAST_PER_SECOND,
+                        concurrency: int = BROADCAST_CONCURRENCY, page_size: int = BROADCAST_PAGE_SIZE):
+    """Send a campaign to every user, resuming from its checkpoint.
+
+    Recipients are streamed in keyset pages; each page is sent with at most `concurrency`
+    requests in flight, paced to `per_second`, and then checkpointed, so a crash repeats at
+    most one page. Cancelling the campaign in the DB stops it at the next page.
+    """
+    if broadcast_id in _active:
+        return
+    campaign = get_broadcast(broadcast_id)
+    if not campaign or campaign[4] != "running":
+        return
+
+    text, parse_mode, last_user_id = campaign[1], campaign[2], campaign[5]
+    pacer = RatePacer(per_second)
+    slots = asyncio.Semaphore(concurrency)
+    started = last_report = time.monotonic()
+    _active[broadcast_id] = (started, 0)
+    try:
+        while True:
+            page = get_user_ids_after(last_user_id, page_size)
+            if not page:
+                checkpoint_broadcast(broadcast_id, last_user_id, 0, 0, status="done")
+                break
+
+            results = await asyncio.gather(
+                *(_send(bot, pacer, slots, user_id, text, parse_mode) for user_id in page)
+            )
+            last_user_id = page[-1]
+            sent = sum(results)
+            checkpoint_broadcast(broadcast_id, last_user_id, sent, len(results) - sent)
+            _active[broadcast_id] = (started, _active[broadcast_id][1] + len(results))
+
+            campaign = get_broadcast(broadcast_id)
+            if campaign[4] != "running":
+                break
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await _report(bot, campaign)
+    finally:
+        final = get_broadcast(broadcast_id)
+        await _report(bot, final)
+        del _active[broadcast_id]
+        print(f"📣 Broadcast #{broadcast_id} stopped: {final[4]}, {final[7]} sent, {final[8]} failed")
+
+
+async def resume_broadcasts(context):
+    """Job: restart campaigns that were still running when the bot went down."""
+    for broadcast_id in get_running_broadcast_ids():
+        context.application.create_task(run_broadcast(context.bot, broadcast_id))
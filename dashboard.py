@@ -0,0 +1,69 @@
+import time
+
+from db import (
+    get_dashboard_gauges, get_pending_count, get_rollup_series, get_rollup_totals, now_ts,
+    refresh_hourly_rollups
+)
+
+DASHBOARD_TTL = 60  # seconds a rendered dashboard is reused
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+_cached_text = None
+_cached_at = 0.0
+
+
+def sparkline(values) -> str:
+    values = list(values)
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_BARS[0] * len(values)
+    return "".join(SPARK_BARS[min(int(v / peak * (len(SPARK_BARS) - 1)), len(SPARK_BARS) - 1)] for v in values)
+
+
+def _period_lines(title: str, totals: dict) -> list[str]:
+    return [
+        f"📅 {title}",
+        f"  📤 Posts: {totals['posts_submitted']} submitted · {totals['posts_approved']} approved · "
+        f"{totals['posts_expired']} expired",
+        f"  ⚔️ Raids: {totals['completions']} completed · {totals['verifications_confirmed']} confirmed",
+        f"  🎯 Slots: +{totals['slots_earned']:g} earned · -{totals['slots_spent']:g} spent",
+        f"  👥 {totals['new_users']} new user(s) · 🤝 {totals['follow_actions']} follow action(s)",
+    ]
+
+
+def render_dashboard() -> str:
+    current_hour = now_ts() // 3600
+    gauges = get_dashboard_gauges()
+    day = get_rollup_totals(current_hour - 23)
+    week = get_rollup_totals(current_hour - 24 * 7 + 1)
+    hourly = dict(get_rollup_series("completions", current_hour - 23))
+
+    lines = [
+        "📊 Admin Dashboard\n",
+        f"👥 Users: {gauges['users']} · 🕓 Pending posts: {get_pending_count()} · "
+        f"🔥 Live raids: {gauges['live_raids']} · 📬 Outbox: {gauges['outbox_pending']}\n",
+        *_period_lines("Last 24 hours", day),
+        "",
+        *_period_lines("Last 7 days", week),
+        "",
+        "⚔️ Completions per hour (24h):",
+        sparkline(hourly.get(hour, 0) for hour in range(current_hour - 23, current_hour + 1)),
+        "",
+        "💾 /backup sends a database snapshot · /export streams a table as CSV.",
+    ]
+    return "\n".join(lines)
+
+
+def get_dashboard() -> str:
+    """The dashboard text, rebuilt at most once per DASHBOARD_TTL."""
+    global _cached_text, _cached_at
+    if _cached_text is None or time.monotonic() - _cached_at >= DASHBOARD_TTL:
+        refresh_hourly_rollups()  # only the current hour and anything since the last run
+        _cached_text = render_dashboard()
+        _cached_at = time.monotonic()
+    return _cached_text
+
+
+async def rollup_job(context):
+    """Job: keep stats_hourly current even when nobody opens the dashboard."""
+    refresh_hourly_rollups()
@@ -1,15 +1,464 @@
+import json
+import os
 import re
 import sqlite3
-from datetime import datetime, timedelta
+import time
+from collections import namedtuple
+from itertools import islice
+
+# ───── Connection Config ─────────────────────────────────
+# BOT_DB may be a file path (e.g. bot_data.db, or /dev/shm/bot_data.db on tmpfs),
+# ":memory:" for a process-wide shared in-memory database, or a full "file:" URI.
+
+DB_FILE = os.getenv("BOT_DB", "bot_data.db")
+MEMORY_URI = "file:bot_data?mode=memory&cache=shared"
+# Old posts, raids and slot logs are moved to an archive database (see archive.py) kept next
+# to the main one as <name>_archive.db unless BOT_ARCHIVE_DB names another file.
+ARCHIVE_DB = os.getenv("BOT_ARCHIVE_DB")
+ARCHIVE_MEMORY_URI = "file:bot_archive?mode=memory&cache=shared"
+
+RAID_DURATION = 24 * 3600  # seconds an approved post stays live
+BAN_GRACE = 4 * 3600  # time owners get after expiry to review raids
+BAN_DURATION = 48 * 3600
+RAID_REWARD = 0.1  # slots credited to a raider per confirmed raid
+OUTBOX_MAX_ATTEMPTS = 5  # deliveries tried before a notification is marked failed
+
+_db_target = None
+_db_is_uri = False
+_memory_anchor = None
+_archive_anchor = None
+_archive_columns = {}  # archived table -> columns, filled once by ensure_archive_schema
+
+
+def configure_db(location: str):
+    """Point every connection at `location` (see BOT_DB above)."""
+    global DB_FILE, _db_target, _db_is_uri, _memory_anchor
+    DB_FILE = location
+    _archive_columns.clear()
+    if location == ":memory:":
+        _db_target, _db_is_uri = MEMORY_URI, True
+        # A shared in-memory DB only lives while at least one connection is open
+        if _memory_anchor is None:
+            _memory_anchor = sqlite3.connect(MEMORY_URI, uri=True, check_same_thread=False)
+    else:
+        _db_target, _db_is_uri = location, location.startswith("file:")
+
+
+def connect() -> sqlite3.Connection:
+    if _db_target is None:
+        configure_db(DB_FILE)
+    return sqlite3.connect(_db_target, uri=_db_is_uri, timeout=10)
+
+
+def backup_db(dest_path: str):
+    """Copy a consistent snapshot of the database (any mode) to a file."""
+    src = connect()
+    dest = sqlite3.connect(dest_path)
+    src.backup(dest)
+    dest.close()
+    src.close()
+
+# ───── Streaming Reads ───────────────────────────────────
+# iter_* functions yield compact namedtuple records a page at a time. Each page is its own
+# short query resuming after the last row's sort key (keyset paging, no OFFSET), and the
+# connection is closed before any record is handed out: an open read would pin its WAL
+# snapshot (or, in rollback-journal mode, block writers) for as long as the caller takes
+# between records, e.g. while it awaits sends.
+
+STREAM_PAGE_SIZE = 200
+
+FollowSuggestion = namedtuple("FollowSuggestion", "telegram_id name twitter_handle")
+LiveRaidPost = namedtuple("LiveRaidPost", "id post_link name expires_at")
+PendingPost = namedtuple("PendingPost", "id post_link name telegram_id slots")
+RaidVerification = namedtuple("RaidVerification", "doer_id name twitter_handle status")
+
+
+def _iter_keyset(record, select: str, source: str, params=(), keyset=("id",), descending=False,
+                 page_size: int = STREAM_PAGE_SIZE):
+    """Yield `record`s for `SELECT select FROM source` in keyset order.
+
+    `source` is everything from the tables up to and including the WHERE clause; `keyset`
+    columns must make the order unique (end with a primary key) and be non-NULL.
+    """
+    width = len(record._fields)
+    keys = ", ".join(keyset)
+    direction = " DESC" if descending else ""
+    after = None
+    while True:
+        query = f"SELECT {select}, {keys} FROM {source}"
+        args = list(params)
+        if after is not None:
+            query += f" AND ({keys}) {'<' if descending else '>'} ({', '.join('?' * len(keyset))})"
+            args.extend(after)
+        query += f" ORDER BY {', '.join(k + direction for k in keyset)} LIMIT ?"
+        conn = connect()
+        try:
+            rows = conn.execute(query, (*args, page_size)).fetchmany(page_size)
+        finally:
+            conn.close()
+        for row in rows:
+            yield record._make(row[:width])
+        if len(rows) < page_size:
+            return
+        after = rows[-1][width:]
+
+# ───── Schema ────────────────────────────────────────────
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id          INTEGER PRIMARY KEY,
+    name                 TEXT,
+    ref_by               INTEGER,
+    slots                REAL DEFAULT 2,
+    task_slots           REAL DEFAULT 0,
+    ref_count_l1         INTEGER DEFAULT 0,
+    twitter_handle       TEXT UNIQUE,
+    twitter_id           TEXT,
+    access_token         TEXT,
+    refresh_token        TEXT,
+    token_expiry         INTEGER,
+    access_token_secret  TEXT,
+    created_at           INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    last_updated         INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    banned_until         INTEGER,
+    post_ban_until       INTEGER,
+    last_post_at         INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id   INTEGER REFERENCES users(telegram_id),
+    post_link     TEXT,
+    group_id      INTEGER,
+    status        TEXT DEFAULT 'pending',
+    submitted_at  INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    approved_at   INTEGER,
+    expires_at    INTEGER,
+    tweet_id      INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS slot_logs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id  INTEGER REFERENCES users(telegram_id),
+    slots        REAL,
+    reason       TEXT,
+    note         TEXT,
+    created_at   INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+CREATE TABLE IF NOT EXISTS completions (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id  INTEGER REFERENCES users(telegram_id),
+    post_id      INTEGER REFERENCES posts(id),
+    created_at   INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    UNIQUE(telegram_id, post_id)
+);
+
+CREATE TABLE IF NOT EXISTS verifications (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id      INTEGER,
+    doer_id      INTEGER,
+    owner_id     INTEGER,
+    status       TEXT DEFAULT 'pending',
+    created_at   INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    updated_at   INTEGER,
+    confirmed    INTEGER DEFAULT 0,
+    responded    INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS follow_actions (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    follower_id  INTEGER REFERENCES users(telegram_id),
+    followed_id  INTEGER REFERENCES users(telegram_id),
+    confirmed    INTEGER DEFAULT 0,
+    responded    INTEGER DEFAULT 0,
+    created_at   INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+CREATE TABLE IF NOT EXISTS follow_pool (
+    telegram_id     INTEGER PRIMARY KEY,
+    twitter_handle  TEXT,
+    joined_at       INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+CREATE TABLE IF NOT EXISTS referral_paths (
+    ancestor    INTEGER NOT NULL,
+    descendant  INTEGER NOT NULL,
+    depth       INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, depth, descendant)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_state (
+    telegram_id  INTEGER PRIMARY KEY,
+    flags        INTEGER NOT NULL,
+    updated_at   INTEGER
+) WITHOUT ROWID;
+
+-- Per-user totals of rows moved to the archive, so history-wide stats never touch it
+CREATE TABLE IF NOT EXISTS archived_user_totals (
+    telegram_id     INTEGER PRIMARY KEY,
+    posts_rejected  INTEGER NOT NULL DEFAULT 0,
+    raids_confirmed INTEGER NOT NULL DEFAULT 0,
+    task_slots      REAL NOT NULL DEFAULT 0,
+    referral_slots  REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS job_state (
+    name   TEXT PRIMARY KEY,
+    value  INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id          INTEGER NOT NULL,
+    text             TEXT NOT NULL,
+    parse_mode       TEXT,
+    reply_markup     TEXT,
+    status           TEXT NOT NULL DEFAULT 'pending',
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at  INTEGER NOT NULL,
+    last_error       TEXT,
+    created_at       INTEGER NOT NULL,
+    sent_at          INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS unreachable_chats (
+    chat_id    INTEGER PRIMARY KEY,
+    reason     TEXT,
+    marked_at  INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS digest_prefs (
+    telegram_id       INTEGER PRIMARY KEY,
+    interval_seconds  INTEGER NOT NULL,
+    max_events        INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS digest_events (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient_id  INTEGER NOT NULL,
+    kind          TEXT NOT NULL,
+    actor_id      INTEGER,
+    actor_name    TEXT,
+    post_id       INTEGER,
+    created_at    INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    hour                     INTEGER PRIMARY KEY,  -- epoch seconds // 3600
+    posts_submitted          INTEGER NOT NULL DEFAULT 0,
+    posts_approved           INTEGER NOT NULL DEFAULT 0,
+    posts_expired            INTEGER NOT NULL DEFAULT 0,
+    completions              INTEGER NOT NULL DEFAULT 0,
+    verifications_confirmed  INTEGER NOT NULL DEFAULT 0,
+    slots_earned             REAL NOT NULL DEFAULT 0,
+    slots_spent              REAL NOT NULL DEFAULT 0,
+    new_users                INTEGER NOT NULL DEFAULT 0,
+    follow_actions           INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS engagement_weekly (
+    week_start         INTEGER NOT NULL,  -- epoch seconds of the week's Monday 00:00 UTC
+    telegram_id        INTEGER NOT NULL,
+    raids_done         INTEGER NOT NULL DEFAULT 0,
+    raids_received     INTEGER NOT NULL DEFAULT 0,
+    raids_confirmed    INTEGER NOT NULL DEFAULT 0,
+    raids_rejected     INTEGER NOT NULL DEFAULT 0,
+    confirmation_rate  REAL,              -- NULL until a raid of theirs is settled
+    follows_given      INTEGER NOT NULL DEFAULT 0,
+    follow_backs       INTEGER NOT NULL DEFAULT 0,
+    reciprocity        REAL,
+    slots_earned       REAL NOT NULL DEFAULT 0,
+    slots_spent        REAL NOT NULL DEFAULT 0,
+    slot_velocity      REAL NOT NULL DEFAULT 0,  -- slots earned per day
+    computed_at        INTEGER NOT NULL,
+    PRIMARY KEY (week_start, telegram_id)
+);
+
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    text          TEXT NOT NULL,
+    parse_mode    TEXT,
+    created_by    INTEGER,
+    status        TEXT NOT NULL DEFAULT 'running',
+    last_user_id  INTEGER NOT NULL DEFAULT 0,
+    total         INTEGER NOT NULL DEFAULT 0,
+    sent          INTEGER NOT NULL DEFAULT 0,
+    failed        INTEGER NOT NULL DEFAULT 0,
+    created_at    INTEGER NOT NULL,
+    finished_at   INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status);
+CREATE INDEX IF NOT EXISTS idx_posts_telegram_id ON posts(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_posts_approved_at ON posts(approved_at);
+CREATE INDEX IF NOT EXISTS idx_posts_submitted_at ON posts(submitted_at);
+CREATE INDEX IF NOT EXISTS idx_completions_post ON completions(post_id);
+CREATE INDEX IF NOT EXISTS idx_verifications_post ON verifications(post_id, doer_id);
+CREATE INDEX IF NOT EXISTS idx_slot_logs_user ON slot_logs(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_follow_actions_followed ON follow_actions(followed_id);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);
+CREATE INDEX IF NOT EXISTS idx_completions_created_at ON completions(created_at);
+CREATE INDEX IF NOT EXISTS idx_verifications_updated_at ON verifications(updated_at);
+CREATE INDEX IF NOT EXISTS idx_slot_logs_created_at ON slot_logs(created_at);
+CREATE INDEX IF NOT EXISTS idx_follow_actions_created_at ON follow_actions(created_at);
+CREATE INDEX IF NOT EXISTS idx_referral_paths_descendant ON referral_paths(descendant, depth);
+CREATE INDEX IF NOT EXISTS idx_digest_events_recipient ON digest_events(recipient_id, id);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at) WHERE status = 'pending';
+"""
+
+
+# ───── Migrations ────────────────────────────────────────
+# Applied in order on top of SCHEMA; PRAGMA user_version records how many have run.
+
+TIMESTAMP_COLUMNS = {
+    "users": ("token_expiry", "created_at", "last_updated", "banned_until", "post_ban_until", "last_post_at"),
+    "posts": ("submitted_at", "approved_at", "expires_at"),
+    "slot_logs": ("created_at",),
+    "completions": ("created_at",),
+    "verifications": ("created_at", "updated_at"),
+    "follow_actions": ("created_at",),
+    "follow_pool": ("joined_at",),
+}
+
+
+def _migrate_epoch_timestamps(conn):
+    """Rewrite datetime/ISO/CURRENT_TIMESTAMP strings as integer epoch seconds (UTC)."""
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            conn.execute(f"""
+                UPDATE {table}
+                SET {column} = CAST(strftime('%s', {column}) AS INTEGER)
+                WHERE typeof({column}) = 'text'
+            """)
+
+
+def _migrate_posts_expires_at(conn):
+    """Backfill expires_at for already-approved posts and index the live feed by it."""
+    conn.execute("""
+        UPDATE posts
+        SET expires_at = approved_at + ?
+        WHERE approved_at IS NOT NULL AND expires_at IS NULL
+    """, (RAID_DURATION,))
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_posts_active_expires
+        ON posts(expires_at) WHERE status = 'approved'
+    """)
+    # Without stats the planner prefers idx_posts_status's equality match over this range scan
+    conn.execute("ANALYZE posts")
+
+
+def _migrate_ban_sweep_index(conn):
+    """The ban sweep scans every post by expires_at window, whatever its status."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_expires_at ON posts(expires_at)")
+    # Bans used to land in the unenforced banned_until column; don't retroactively apply them
+    conn.execute("""
+        INSERT OR IGNORE INTO job_state (name, value)
+        VALUES ('ban_sweep_watermark', ?)
+    """, (now_ts() - BAN_GRACE,))
+
+
+def _migrate_unique_follow_actions(conn):
+    """One follow_actions row per (follower, followed) pair so repeated taps can't duplicate it."""
+    conn.execute("""
+        DELETE FROM follow_actions
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM follow_actions GROUP BY follower_id, followed_id
+        )
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_follow_actions_follower")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_follow_actions_pair
+        ON follow_actions(follower_id, followed_id)
+    """)
+
+
+def _migrate_posts_tweet_id(conn):
+    """Canonical tweet IDs for posts, unique among posts that are pending or live.
+
+    Older duplicates keep a NULL tweet_id (only the earliest active copy gets it) and
+    drop out naturally when they expire.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(posts)")}
+    if "tweet_id" not in columns:
+        conn.execute("ALTER TABLE posts ADD COLUMN tweet_id INTEGER")
+    seen = set()
+    updates = []
+    for post_id, link, status in conn.execute("SELECT id, post_link, status FROM posts ORDER BY id"):
+        parsed = parse_tweet_link(link or "")
+        if not parsed:
+            continue
+        active = status in ("pending", "approved")
+        if active and parsed[1] in seen:
+            continue
+        if active:
+            seen.add(parsed[1])
+        updates.append((parsed[1], post_id))
+    conn.executemany("UPDATE posts SET tweet_id = ? WHERE id = ?", updates)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_active_tweet
+        ON posts(tweet_id) WHERE status IN ('pending', 'approved')
+    """)
+
+
+def _migrate_referral_paths(conn):
+    """Backfill the referral closure table from users.ref_by (depth-capped against bad cycles)."""
+    conn.execute("""
+        WITH RECURSIVE chain(ancestor, descendant, depth) AS (
+            SELECT ref_by, telegram_id, 1 FROM users
+            WHERE ref_by IS NOT NULL AND ref_by != telegram_id
+            UNION ALL
+            SELECT u.ref_by, c.descendant, c.depth + 1
+            FROM chain c JOIN users u ON u.telegram_id = c.ancestor
+            WHERE u.ref_by IS NOT NULL AND u.ref_by != u.telegram_id AND c.depth < 64
+        )
+        INSERT OR IGNORE INTO referral_paths (ancestor, descendant, depth)
+        SELECT ancestor, descendant, depth FROM chain
+    """)
+
+
+MIGRATIONS = [
+    _migrate_epoch_timestamps,
+    _migrate_posts_expires_at,
+    _migrate_ban_sweep_index,
+    _migrate_unique_follow_actions,
+    _migrate_posts_tweet_id,
+    _migrate_referral_paths,
+]
+
+
+def init_db():
+    """Create every table and index the bot uses and apply pending migrations.
+    Safe to run on an existing database."""
+    conn = connect()
+    # Only takes effect on a brand-new file; /maintenance vacuum converts existing ones
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # Persistent: readers stop blocking writers and maintenance.py checkpoints the -wal file.
+    # In-memory databases stay in "memory" mode.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+        print(f"🗄️ Applied DB migration {number}: {migration.__name__}")
+    conn.close()
+    ensure_archive_schema()
 
-DB_FILE = "bot_data.db"
+
+def now_ts() -> int:
+    """Current UTC time as integer epoch seconds — the only timestamp format stored."""
+    return int(time.time())
 
 # ───── Twitter Handle Helpers ────────────────────────────
 
 
 def set_twitter_handle(telegram_id: int, handle: str) -> bool:
     """Sets a user's Twitter handle if not taken by another user"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
 
     c.execute(
@@ -22,71 +471,84 @@ def set_twitter_handle(telegram_id: int, handle: str) -> bool:
 
     c.execute(
         "UPDATE users SET twitter_handle = ?, last_updated = ? WHERE telegram_id = ?",
-        (handle, datetime.utcnow(), telegram_id)
+        (handle, now_ts(), telegram_id)
     )
     conn.commit()
     conn.close()
     return True
 
 
+# Status links on twitter.com / x.com (www. and mobile. too); query strings and anything
+# after the ID are ignored. Compiled once, shared by bot.py and the posts backfill.
+TWEET_LINK_RE = re.compile(
+    r"(?<![\w.-])(?:https?://)?(?:www\.|mobile\.)?(?:twitter|x)\.com/(\w{1,15})/status(?:es)?/(\d{1,19})",
+    re.IGNORECASE
+)
+
+
+def parse_tweet_link(link: str) -> tuple[str, int] | None:
+    """(handle, tweet_id) for a tweet link, or None if it isn't one."""
+    match = TWEET_LINK_RE.search(link)
+    if not match:
+        return None
+    tweet_id = int(match.group(2))
+    if tweet_id > 2 ** 63 - 1:  # wouldn't fit SQLite's INTEGER; no real status ID is this big
+        return None
+    return match.group(1), tweet_id
+
+
+def canonical_tweet_link(handle: str, tweet_id: int) -> str:
+    return f"https://x.com/{handle}/status/{tweet_id}"
+
+
 def is_valid_tweet_link(link: str) -> bool:
-    pattern = r"^https://(twitter\.com|x\.com)/[^/]+/status/\d+"
-    return bool(re.match(pattern, link.strip()))
+    return parse_tweet_link(link) is not None
 
 
 def is_user_banned(telegram_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
-        "SELECT post_ban_until FROM users WHERE telegram_id = ?",
-        (telegram_id,)
+        "SELECT 1 FROM users WHERE telegram_id = ? AND post_ban_until > ?",
+        (telegram_id, now_ts())
     ).fetchone()
     conn.close()
-
-    if row and row[0]:
-        ban_time = datetime.fromisoformat(row[0])
-        return datetime.utcnow() < ban_time
-    return False
+    return row is not None
 
 
 def get_user_active_posts(telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     rows = conn.execute("""
-        SELECT id, post_link, approved_at
+        SELECT id, post_link, expires_at
         FROM posts
         WHERE telegram_id = ? AND status = 'approved'
-        AND approved_at >= datetime('now', '-24 hours')
-    """, (telegram_id,)).fetchall()
+        AND expires_at > ?
+    """, (telegram_id, now_ts())).fetchall()
     conn.close()
     return rows
 
 
 def update_last_post_time(user_id: int):
     """Update the last post timestamp for a user"""
-    # Implementation depends on your database
-    # Example for SQLite:
-    conn = sqlite3.connect('bot_data.db')
+    conn = connect()
     c = conn.cursor()
     c.execute("UPDATE users SET last_post_at = ? WHERE telegram_id = ?",
-              (datetime.utcnow().isoformat(), user_id))
+              (now_ts(), user_id))
     conn.commit()
     conn.close()
 
 
 def is_in_cooldown(telegram_id: int, cooldown_hours: int) -> tuple[bool, str | None]:
     """Returns True if user is in cooldown and how much time is left, otherwise False."""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
         "SELECT last_post_at FROM users WHERE telegram_id = ?", (telegram_id,)
     ).fetchone()
     conn.close()
 
     if row and row[0]:
-        last_post_at = datetime.fromisoformat(row[0])
-        time_since_last_post = datetime.utcnow() - last_post_at
-
-        if time_since_last_post.total_seconds() < cooldown_hours * 3600:
-            remaining = timedelta(hours=cooldown_hours) - time_since_last_post
-            hours, remainder = divmod(remaining.seconds, 3600)
+        remaining = row[0] + cooldown_hours * 3600 - now_ts()
+        if remaining > 0:
+            hours, remainder = divmod(remaining, 3600)
             minutes = remainder // 60
             return True, f"{hours}h {minutes}m"
     return False, None
@@ -98,19 +560,17 @@ def get_cooldown_remaining(user_id: int, cooldown_hours: int) -> str:
     if not user_data or not user_data.get("last_post_at"):
         return "0 hours 0 minutes"
 
-    last_post_at = datetime.fromisoformat(user_data["last_post_at"])
-    time_since_last_post = datetime.utcnow() - last_post_at
-    remaining = timedelta(hours=cooldown_hours) - time_since_last_post
+    remaining = max(0, user_data["last_post_at"] + cooldown_hours * 3600 - now_ts())
 
     # Format as "X hours Y minutes"
-    hours = remaining.seconds // 3600
-    minutes = (remaining.seconds % 3600) // 60
+    hours = remaining // 3600
+    minutes = (remaining % 3600) // 60
     return f"{hours} hours {minutes} minutes"
 
 
 def get_twitter_handle(telegram_id: int) -> str | None:
     """Gets the user's saved Twitter handle"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
         "SELECT twitter_handle FROM users WHERE telegram_id = ?",
         (telegram_id,)
@@ -118,20 +578,171 @@ def get_twitter_handle(telegram_id: int) -> str | None:
     conn.close()
     return row[0] if row and row[0] else None
 
+# ───── Referral Tree ─────────────────────────────────────
+# referral_paths holds one row per (ancestor, descendant) pair at every depth, so per-user
+# tree questions are primary key range scans instead of recursive walks over users.ref_by.
+# Ranking the largest trees still groups the whole table; it's an admin-only command.
+
+
+def get_referral_depth_counts(telegram_id: int, max_depth: int = 3) -> dict[int, int]:
+    """Referrals per level below a user, e.g. {1: 12, 2: 30, 3: 4}."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT depth, COUNT(*) FROM referral_paths
+        WHERE ancestor = ? AND depth <= ?
+        GROUP BY depth
+    """, (telegram_id, max_depth)).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def get_referral_subtree_size(telegram_id: int) -> int:
+    conn = connect()
+    size = conn.execute(
+        "SELECT COUNT(*) FROM referral_paths WHERE ancestor = ?", (telegram_id,)
+    ).fetchone()[0]
+    conn.close()
+    return size
+
+
+def get_top_referral_trees(limit: int = 10) -> list[tuple[int, str, int]]:
+    """[(telegram_id, name, subtree_size)] for the largest referral trees."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT t.ancestor, u.name, t.size
+        FROM (
+            SELECT ancestor, COUNT(*) AS size FROM referral_paths
+            GROUP BY ancestor ORDER BY size DESC LIMIT ?
+        ) t
+        LEFT JOIN users u ON u.telegram_id = t.ancestor
+        ORDER BY t.size DESC
+    """, (limit,)).fetchall()
+    conn.close()
+    return rows
+
+# ───── Leaderboards ──────────────────────────────────────
+# Startup seeds for leaderboard.py. Each returns (user_id, score) totals, or
+# (day, user_id, score) rows since `since` where day = epoch seconds // 86400.
+
+
+def get_confirmed_raid_totals():
+    conn = connect()
+    rows = conn.execute("""
+        SELECT doer_id, SUM(n) FROM (
+            SELECT doer_id, COUNT(*) AS n FROM verifications WHERE status = 'confirmed' GROUP BY doer_id
+            UNION ALL
+            SELECT telegram_id, raids_confirmed FROM archived_user_totals WHERE raids_confirmed > 0
+        )
+        GROUP BY doer_id
+    """).fetchall()
+    conn.close()
+    return rows
+
+
+def get_confirmed_raids_by_day(since: int):
+    conn = connect()
+    rows = conn.execute("""
+        SELECT updated_at / 86400, doer_id, COUNT(*) FROM verifications
+        WHERE status = 'confirmed' AND updated_at >= ?
+        GROUP BY 1, 2
+    """, (since,)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_task_slot_totals():
+    conn = connect()
+    rows = conn.execute("SELECT telegram_id, task_slots FROM users WHERE task_slots > 0").fetchall()
+    conn.close()
+    return rows
+
+
+def get_task_slots_by_day(since: int):
+    conn = connect()
+    rows = conn.execute("""
+        SELECT created_at / 86400, telegram_id, SUM(slots) FROM slot_logs
+        WHERE reason = 'task' AND created_at >= ?
+        GROUP BY 1, 2
+    """, (since,)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_referral_totals():
+    conn = connect()
+    rows = conn.execute("SELECT telegram_id, ref_count_l1 FROM users WHERE ref_count_l1 > 0").fetchall()
+    conn.close()
+    return rows
+
+
+def get_referrals_by_day(since: int):
+    conn = connect()
+    rows = conn.execute("""
+        SELECT created_at / 86400, ref_by, COUNT(*) FROM users
+        WHERE ref_by IS NOT NULL AND created_at >= ?
+        GROUP BY 1, 2
+    """, (since,)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_user_names(telegram_ids) -> dict[int, str]:
+    telegram_ids = list(telegram_ids)
+    if not telegram_ids:
+        return {}
+    conn = connect()
+    rows = conn.execute(
+        f"SELECT telegram_id, COALESCE(twitter_handle, name) FROM users "
+        f"WHERE telegram_id IN ({','.join('?' * len(telegram_ids))})",
+        telegram_ids
+    ).fetchall()
+    conn.close()
+    return dict(rows)
+
+# ───── Conversation State ────────────────────────────────
+
+
+def load_user_flags(telegram_id: int) -> int:
+    conn = connect()
+    row = conn.execute(
+        "SELECT flags FROM user_state WHERE telegram_id = ?", (telegram_id,)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def save_user_flags(rows):
+    """rows: iterable of (telegram_id, flags). Users with no flags left are removed."""
+    now = now_ts()
+    rows = list(rows)
+    conn = connect()
+    conn.executemany("""
+        INSERT OR REPLACE INTO user_state (telegram_id, flags, updated_at)
+        VALUES (?, ?, ?)
+    """, [(user_id, flags, now) for user_id, flags in rows if flags])
+    conn.executemany(
+        "DELETE FROM user_state WHERE telegram_id = ?",
+        [(user_id,) for user_id, flags in rows if not flags]
+    )
+    conn.commit()
+    conn.close()
+
 # ───── Users ─────────────────────────────────────────────
 
 
 def add_user(telegram_id, name, ref_by=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
 
     if c.execute("SELECT 1 FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone():
         conn.close()
         return False
 
+    now = now_ts()
     c.execute(
-        "INSERT INTO users (telegram_id, name, ref_by, slots, task_slots, ref_count_l1) VALUES (?, ?, ?, 2, 0, 0)",
-        (telegram_id, name, ref_by)
+        "INSERT INTO users (telegram_id, name, ref_by, slots, task_slots, ref_count_l1, created_at, last_updated) "
+        "VALUES (?, ?, ?, 2, 0, 0, ?, ?)",
+        (telegram_id, name, ref_by, now, now)
     )
 
     if ref_by:
@@ -142,10 +753,20 @@ def add_user(telegram_id, name, ref_by=None):
             WHERE telegram_id = ?
         """, (ref_by,))
 
+        # Closure rows: the referrer at depth 1, plus every ancestor of the referrer one level
+        # deeper. Like migration 6, a self-referral (/start <own id>) gets none.
+        if ref_by != telegram_id:
+            c.execute("""
+                INSERT OR IGNORE INTO referral_paths (ancestor, descendant, depth)
+                SELECT ?, ?, 1
+                UNION ALL
+                SELECT ancestor, ?, depth + 1 FROM referral_paths WHERE descendant = ?
+            """, (ref_by, telegram_id, telegram_id, ref_by))
+
         c.execute("""
             INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
             VALUES (?, ?, 'referral', ?)
-        """, (ref_by, 0.2, datetime.utcnow()))
+        """, (ref_by, 0.2, now))
 
     conn.commit()
     conn.close()
@@ -153,7 +774,7 @@ def add_user(telegram_id, name, ref_by=None):
 
 
 def get_user(telegram_id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     conn.row_factory = sqlite3.Row
     user = conn.execute(
         "SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)
@@ -163,7 +784,7 @@ def get_user(telegram_id):
 
 
 def get_user_slots(telegram_id: int) -> int:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
         "SELECT slots FROM users WHERE telegram_id = ?", (telegram_id,)
     ).fetchone()
@@ -172,7 +793,7 @@ def get_user_slots(telegram_id: int) -> int:
 
 
 def deduct_slot_by_admin(telegram_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     row = c.execute("SELECT slots FROM users WHERE telegram_id = ?",
                     (telegram_id,)).fetchone()
@@ -181,6 +802,10 @@ def deduct_slot_by_admin(telegram_id: int) -> bool:
             "UPDATE users SET slots = slots - 1 WHERE telegram_id = ?",
             (telegram_id,)
         )
+        c.execute("""
+            INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
+            VALUES (?, -1, 'post', ?)
+        """, (telegram_id, now_ts()))
         conn.commit()
         conn.close()
         return True
@@ -188,45 +813,51 @@ def deduct_slot_by_admin(telegram_id: int) -> bool:
     return False
 
 
-def create_follow_action(follower_id: int, followed_id: int):
-    """Log a follow action between users."""
-    conn = sqlite3.connect(DB_FILE)
+def create_follow_action(follower_id: int, followed_id: int) -> bool:
+    """Log a follow action between users. Returns False if it was already logged."""
+    conn = connect()
     c = conn.cursor()
     c.execute("""
-        INSERT INTO follow_actions (follower_id, followed_id)
-        VALUES (?, ?)
-    """, (follower_id, followed_id))
+        INSERT OR IGNORE INTO follow_actions (follower_id, followed_id, created_at)
+        VALUES (?, ?, ?)
+    """, (follower_id, followed_id, now_ts()))
+    created = c.rowcount == 1
     conn.commit()
     conn.close()
+    return created
 
 
-def confirm_follow_back(followed_id: int, follower_id: int):
-    """Mark the follow as confirmed (mutual)"""
-    conn = sqlite3.connect(DB_FILE)
+def confirm_follow_back(followed_id: int, follower_id: int) -> bool:
+    """Mark the follow as confirmed (mutual). Returns False if it was already answered."""
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         UPDATE follow_actions
-        SET confirmed = 1
-        WHERE follower_id = ? AND followed_id = ?
+        SET confirmed = 1, responded = 1
+        WHERE follower_id = ? AND followed_id = ? AND responded = 0
     """, (follower_id, followed_id))
+    changed = c.rowcount > 0
     conn.commit()
     conn.close()
+    return changed
 
 
-def ignore_follow(followed_id: int, follower_id: int):
-    conn = sqlite3.connect(DB_FILE)
+def ignore_follow(followed_id: int, follower_id: int) -> bool:
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         UPDATE follow_actions
         SET responded = 1
-        WHERE follower_id = ? AND followed_id = ?
+        WHERE follower_id = ? AND followed_id = ? AND responded = 0
     """, (follower_id, followed_id))
+    changed = c.rowcount > 0
     conn.commit()
     conn.close()
+    return changed
 
 
 def get_pending_followers(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     rows = conn.execute("""
         SELECT f.follower_id, u.name, u.twitter_handle
         FROM follow_actions f
@@ -238,18 +869,19 @@ def get_pending_followers(user_id: int):
 
 
 def add_task_slot(telegram_id: int, amount: float):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
+    now = now_ts()
     c.execute("""
         UPDATE users
         SET task_slots = task_slots + ?, slots = slots + ?, last_updated = ?
         WHERE telegram_id = ?
-    """, (amount, amount, datetime.utcnow(), telegram_id))
+    """, (amount, amount, now, telegram_id))
 
     c.execute("""
         INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
         VALUES (?, ?, 'task', ?)
-    """, (telegram_id, amount, datetime.utcnow()))
+    """, (telegram_id, amount, now))
     conn.commit()
     conn.close()
 
@@ -257,7 +889,7 @@ def add_task_slot(telegram_id: int, amount: float):
 
 
 def has_completed_post(telegram_id: int, post_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute(
         "SELECT 1 FROM completions WHERE telegram_id = ? AND post_id = ?",
@@ -269,35 +901,51 @@ def has_completed_post(telegram_id: int, post_id: int) -> bool:
 
 
 def mark_post_completed(telegram_id: int, post_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         INSERT OR IGNORE INTO completions (telegram_id, post_id, created_at)
         VALUES (?, ?, ?)
-    """, (telegram_id, post_id, datetime.utcnow()))
+    """, (telegram_id, post_id, now_ts()))
     conn.commit()
     conn.close()
 
 # ───── Posts ─────────────────────────────────────────────
 
 
-def save_post(telegram_id: int, post_link: str, group_id: int = None):
-    conn = sqlite3.connect(DB_FILE)
+def save_post(telegram_id: int, post_link: str, group_id: int = None) -> bool:
+    """Store a post under its canonical link.
+
+    Returns False if the link isn't a tweet or the same tweet is already pending or live;
+    the unique index on tweet_id answers that with one index lookup.
+    """
+    parsed = parse_tweet_link(post_link)
+    if not parsed:
+        return False
+    handle, tweet_id = parsed
+    conn = connect()
     c = conn.cursor()
-    c.execute(
-        "INSERT INTO posts (telegram_id, post_link, group_id, status) VALUES (?, ?, ?, ?)",
-        (telegram_id, post_link, group_id, "pending")
-    )
+    now = now_ts()
+    try:
+        c.execute("""
+            INSERT INTO posts (telegram_id, post_link, tweet_id, group_id, status, submitted_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (telegram_id, canonical_tweet_link(handle, tweet_id), tweet_id, group_id, "pending", now))
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        conn.close()
+        return False
     c.execute(
         "UPDATE users SET last_post_at = ? WHERE telegram_id = ?",
-        (datetime.utcnow(), telegram_id)
+        (now, telegram_id)
     )
     conn.commit()
     conn.close()
+    return True
 
 
 def get_post_link_by_id(post_id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
         "SELECT post_link FROM posts WHERE id = ?", (post_id,)
     ).fetchone()
@@ -305,28 +953,34 @@ def get_post_link_by_id(post_id):
     return row[0] if row else None
 
 
-def get_pending_posts(limit: int = 5):
-    conn = sqlite3.connect(DB_FILE)
-    rows = conn.execute("""
-        SELECT p.id, p.post_link, u.name, p.telegram_id
-        FROM posts p
+def iter_pending_posts(page_size: int = STREAM_PAGE_SIZE):
+    """The moderation queue, oldest submission first, with each owner's current slots."""
+    return _iter_keyset(
+        PendingPost,
+        "p.id, p.post_link, u.name, p.telegram_id, u.slots",
+        """
+        posts p
         JOIN users u ON u.telegram_id = p.telegram_id
         WHERE p.status = 'pending'
-        ORDER BY p.submitted_at ASC
-        LIMIT ?
-    """, (limit,)).fetchall()
-    conn.close()
-    return rows
+        """,
+        keyset=("IFNULL(p.submitted_at, 0)", "p.id"),
+        page_size=page_size,
+    )
+
+
+def get_pending_posts(limit: int = 5):
+    return [row[:4] for row in islice(iter_pending_posts(page_size=limit), limit)]
 
 
 def set_post_status(post_id: int, status: str):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     if status == "approved":
+        now = now_ts()
         conn.execute("""
             UPDATE posts
-            SET status = ?, approved_at = ?
+            SET status = ?, approved_at = ?, expires_at = ?
             WHERE id = ?
-        """, (status, datetime.utcnow(), post_id))
+        """, (status, now, now + RAID_DURATION, post_id))
     else:
         conn.execute(
             "UPDATE posts SET status = ? WHERE id = ?",
@@ -336,19 +990,96 @@ def set_post_status(post_id: int, status: str):
     conn.close()
 
 
+def get_pending_posts_page(page: int = 0, page_size: int = 8):
+    """One page of the moderation queue, oldest first, with each owner's current slots."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT p.id, p.post_link, u.name, p.telegram_id, u.slots
+        FROM posts p
+        JOIN users u ON u.telegram_id = p.telegram_id
+        WHERE p.status = 'pending'
+        ORDER BY p.id ASC
+        LIMIT ? OFFSET ?
+    """, (page_size, page * page_size)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_pending_post_ids() -> list[int]:
+    conn = connect()
+    rows = conn.execute(
+        "SELECT id FROM posts WHERE status = 'pending' ORDER BY id ASC"
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def bulk_moderate_posts(approve_ids=(), reject_ids=()):
+    """Approve and/or reject many pending posts in a single transaction.
+
+    Each approval deducts one slot from the owner exactly like deduct_slot_by_admin; posts
+    whose owner has run out of slots are left pending. Posts no longer pending are ignored.
+    Returns (approved, rejected, skipped) as lists of (post_id, owner_id, post_link).
+    """
+    now = now_ts()
+    approved, rejected, skipped = [], [], []
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+
+    for post_id in approve_ids:
+        row = conn.execute(
+            "SELECT telegram_id, post_link FROM posts WHERE id = ? AND status = 'pending'",
+            (post_id,)
+        ).fetchone()
+        if not row:
+            continue
+        owner_id, link = row
+        charged = conn.execute(
+            "UPDATE users SET slots = slots - 1 WHERE telegram_id = ? AND slots > 0",
+            (owner_id,)
+        ).rowcount
+        if charged:
+            conn.execute("""
+                INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
+                VALUES (?, -1, 'post', ?)
+            """, (owner_id, now))
+        (approved if charged else skipped).append((post_id, owner_id, link))
+
+    for post_id in reject_ids:
+        row = conn.execute(
+            "SELECT telegram_id, post_link FROM posts WHERE id = ? AND status = 'pending'",
+            (post_id,)
+        ).fetchone()
+        if row:
+            rejected.append((post_id, row[0], row[1]))
+
+    conn.executemany("""
+        UPDATE posts
+        SET status = 'approved', approved_at = ?, expires_at = ?
+        WHERE id = ?
+    """, [(now, now + RAID_DURATION, post_id) for post_id, _, _ in approved])
+    conn.executemany(
+        "UPDATE posts SET status = 'rejected' WHERE id = ?",
+        [(post_id,) for post_id, _, _ in rejected]
+    )
+    conn.commit()
+    conn.close()
+    return approved, rejected, skipped
+
+
 def join_follow_pool(telegram_id: int, handle: str):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         INSERT OR REPLACE INTO follow_pool (telegram_id, twitter_handle, joined_at)
         VALUES (?, ?, ?)
-    """, (telegram_id, handle, datetime.utcnow()))
+    """, (telegram_id, handle, now_ts()))
     conn.commit()
     conn.close()
 
 
 def leave_follow_pool(telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("DELETE FROM follow_pool WHERE telegram_id = ?", (telegram_id,))
     conn.commit()
@@ -356,7 +1087,7 @@ def leave_follow_pool(telegram_id: int):
 
 
 def is_in_follow_pool(telegram_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("SELECT 1 FROM follow_pool WHERE telegram_id = ?", (telegram_id,))
     result = c.fetchone()
@@ -364,57 +1095,82 @@ def is_in_follow_pool(telegram_id: int) -> bool:
     return bool(result)
 
 
-def get_follow_suggestions(telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute("""
-        SELECT u.telegram_id, u.name, u.twitter_handle
-        FROM follow_pool p
+def iter_follow_suggestions(telegram_id: int):
+    """Pool members this user hasn't followed yet, longest-waiting first."""
+    return _iter_keyset(
+        FollowSuggestion,
+        "u.telegram_id, u.name, u.twitter_handle",
+        """
+        follow_pool p
         JOIN users u ON p.telegram_id = u.telegram_id
         WHERE p.telegram_id != ?
         AND p.telegram_id NOT IN (
             SELECT followed_id FROM follow_actions WHERE follower_id = ?
         )
-        ORDER BY p.joined_at
-    """, (telegram_id, telegram_id)).fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
-
+        """,
+        (telegram_id, telegram_id),
+        keyset=("IFNULL(p.joined_at, 0)", "p.telegram_id"),
+    )
 
-def get_recent_approved_posts(group_id=None, hours: int = 24, with_time=False):
-    since = datetime.utcnow() - timedelta(hours=hours)
-    conn = sqlite3.connect(DB_FILE)
 
-    if with_time:
-        query = """
-            SELECT p.id, p.post_link, u.name, p.approved_at
-            FROM posts p
-            JOIN users u ON p.telegram_id = u.telegram_id
-            WHERE p.status = 'approved' AND p.approved_at >= ?
-        """
-    else:
-        query = """
-            SELECT p.id, p.post_link, u.name
-            FROM posts p
-            JOIN users u ON p.telegram_id = u.telegram_id
-            WHERE p.status = 'approved' AND p.approved_at >= ?
-        """
+def get_follow_suggestions(telegram_id: int):
+    return [row._asdict() for row in iter_follow_suggestions(telegram_id)]
 
-    params = [since]
 
+def iter_recent_approved_posts(group_id=None):
+    """Live raids (approved and not yet expired), newest submission first."""
+    source = """
+        posts p
+        JOIN users u ON p.telegram_id = u.telegram_id
+        WHERE p.status = 'approved' AND p.expires_at > ?
+    """
+    params = [now_ts()]
     if group_id:
-        query += " AND p.group_id = ?"
+        source += " AND p.group_id = ?"
         params.append(group_id)
+    return _iter_keyset(
+        LiveRaidPost, "p.id, p.post_link, u.name, p.expires_at", source, params,
+        keyset=("IFNULL(p.submitted_at, 0)", "p.id"), descending=True,
+    )
+
+
+def get_recent_approved_posts(group_id=None, with_time=False):
+    """Live raids (approved and not yet expired); with_time adds expires_at."""
+    if with_time:
+        return list(iter_recent_approved_posts(group_id))
+    return [row[:3] for row in iter_recent_approved_posts(group_id)]
 
-    query += " ORDER BY p.submitted_at DESC"
 
-    rows = conn.execute(query, params).fetchall()
+def get_live_raids():
+    """Every live raid with its completion count, for ranking.py:
+    (id, post_link, owner_name, owner_id, group_id, expires_at, completions)."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT p.id, p.post_link, u.name, p.telegram_id, p.group_id, p.expires_at,
+               (SELECT COUNT(*) FROM completions c WHERE c.post_id = p.id)
+        FROM posts p
+        JOIN users u ON p.telegram_id = u.telegram_id
+        WHERE p.status = 'approved' AND p.expires_at > ?
+    """, (now_ts(),)).fetchall()
     conn.close()
     return rows
 
 
+def get_live_completed_post_ids(telegram_id: int) -> set[int]:
+    """Live raids this user has already joined."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT c.post_id
+        FROM completions c
+        JOIN posts p ON p.id = c.post_id
+        WHERE c.telegram_id = ? AND p.status = 'approved' AND p.expires_at > ?
+    """, (telegram_id, now_ts())).fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+
 def count_followers(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute(
         "SELECT COUNT(*) FROM follow_actions WHERE followed_id = ?", (user_id,))
@@ -424,7 +1180,7 @@ def count_followers(user_id: int):
 
 
 def count_follow_backs(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute(
         "SELECT COUNT(*) FROM follow_actions WHERE followed_id = ? AND confirmed = 1", (user_id,))
@@ -434,7 +1190,7 @@ def count_follow_backs(user_id: int):
 
 
 def get_post_owner_id(post_id: int) -> int | None:
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     row = conn.execute(
         "SELECT telegram_id FROM posts WHERE id = ?", (post_id,)).fetchone()
     conn.close()
@@ -442,121 +1198,180 @@ def get_post_owner_id(post_id: int) -> int | None:
 
 
 def create_verification(post_id: int, doer_id: int, owner_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
-        CREATE TABLE IF NOT EXISTS verifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_id INTEGER,
-            doer_id INTEGER,
-            owner_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            confirmed INTEGER DEFAULT 0,
-            responded INTEGER DEFAULT 0
-        )
-    """)
-    c.execute("""
-        INSERT INTO verifications (post_id, doer_id, owner_id)
-        VALUES (?, ?, ?)
-    """, (post_id, doer_id, owner_id))
+        INSERT INTO verifications (post_id, doer_id, owner_id, created_at)
+        VALUES (?, ?, ?, ?)
+    """, (post_id, doer_id, owner_id, now_ts()))
+    conn.commit()
+    conn.close()
+
+
+def close_verification(post_id: int, doer_id: int, status: str = "confirmed") -> bool:
+    """Move a pending verification to `status`. Returns False if it was no longer pending."""
+    conn = connect()
+    changed = conn.execute("""
+        UPDATE verifications
+        SET status = ?, confirmed = ?, responded = 1, updated_at = ?
+        WHERE post_id = ? AND doer_id = ? AND status = 'pending'
+    """, (status, 1 if status == "confirmed" else 0, now_ts(), post_id, doer_id)).rowcount > 0
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def confirm_verification(post_id: int, doer_id: int) -> bool:
+    """pending → confirmed and credit the raider, atomically; a repeat call credits nothing."""
+    now = now_ts()
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    changed = conn.execute("""
+        UPDATE verifications
+        SET status = 'confirmed', confirmed = 1, responded = 1, updated_at = ?
+        WHERE post_id = ? AND doer_id = ? AND status = 'pending'
+    """, (now, post_id, doer_id)).rowcount > 0
+    if changed:
+        conn.execute("""
+            UPDATE users
+            SET task_slots = task_slots + ?, slots = slots + ?, last_updated = ?
+            WHERE telegram_id = ?
+        """, (RAID_REWARD, RAID_REWARD, now, doer_id))
+        conn.execute("""
+            INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
+            VALUES (?, ?, 'task', ?)
+        """, (doer_id, RAID_REWARD, now))
     conn.commit()
     conn.close()
+    return changed
 
 
-def close_verification(post_id: int, doer_id: int):
-    conn = sqlite3.connect(DB_FILE)
+def settle_pending_verifications(post_id: int, owner_id: int, status: str) -> list[int]:
+    """Confirm or reject every pending raid on a post in one transaction.
+
+    Confirming credits RAID_REWARD to each raider and writes their slot logs alongside the
+    status change. Returns the raider IDs that were settled so the caller can notify them.
+    """
+    now = now_ts()
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    doers = [row[0] for row in conn.execute("""
+        SELECT DISTINCT doer_id FROM verifications
+        WHERE post_id = ? AND owner_id = ? AND status = 'pending'
+    """, (post_id, owner_id))]
+
     conn.execute("""
         UPDATE verifications
-        SET status = 'confirmed', updated_at = CURRENT_TIMESTAMP
-        WHERE post_id = ? AND doer_id = ?
-    """, (post_id, doer_id))
+        SET status = ?, confirmed = ?, responded = 1, updated_at = ?
+        WHERE post_id = ? AND owner_id = ? AND status = 'pending'
+    """, (status, 1 if status == "confirmed" else 0, now, post_id, owner_id))
+
+    if status == "confirmed" and doers:
+        conn.executemany("""
+            UPDATE users
+            SET task_slots = task_slots + ?, slots = slots + ?, last_updated = ?
+            WHERE telegram_id = ?
+        """, [(RAID_REWARD, RAID_REWARD, now, doer_id) for doer_id in doers])
+        conn.executemany("""
+            INSERT INTO slot_logs (telegram_id, slots, reason, created_at)
+            VALUES (?, ?, 'task', ?)
+        """, [(doer_id, RAID_REWARD, now) for doer_id in doers])
+
     conn.commit()
     conn.close()
+    return doers
 
 
-def auto_approve_stale_posts(context=None):
-    """Automatically approve posts still pending after 1 hour and notify users."""
-    cutoff = datetime.utcnow() - timedelta(hours=1)
-    conn = sqlite3.connect(DB_FILE)
+def auto_approve_stale_posts():
+    """Automatically approve posts still pending after 1 hour and queue owner notifications."""
+    now = now_ts()
+    cutoff = now - 3600
+    conn = connect()
     conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
 
-    # Fetch posts to approve
-    posts = c.execute("""
+    posts = conn.execute("""
         SELECT id, telegram_id, post_link
         FROM posts
         WHERE status = 'pending' AND submitted_at <= ?
     """, (cutoff,)).fetchall()
 
-    # Approve them
-    c.execute("""
+    # Approve them; the notifications commit (or roll back) together with the approval
+    conn.execute("""
         UPDATE posts
-        SET status = 'approved', approved_at = ?
+        SET status = 'approved', approved_at = ?, expires_at = ?
         WHERE status = 'pending' AND submitted_at <= ?
-    """, (datetime.utcnow(), cutoff))
+    """, (now, now + RAID_DURATION, cutoff))
+    for post in posts:
+        enqueue_notification(
+            conn, post["telegram_id"],
+            f"✅ Your post has been automatically approved:\n🔗 {post['post_link']}"
+        )
 
     conn.commit()
     conn.close()
 
-    if posts and context:
-        for post in posts:
-            try:
-                context.bot.send_message(
-                    telegram_id=post["telegram_id"],
-                    text=f"✅ Your post has been automatically approved:\n🔗 {post['post_link']}"
-                )
-            except Exception as e:
-                print(f"❌ Failed to notify user {post['telegram_id']}: {e}")
-
     if posts:
         print(f"✅ Auto-approved {len(posts)} stale pending post(s).")
 
 
 def ban_unresponsive_post_owners():
-    """Ban users whose approved posts expired 4+ hours ago without confirming/rejecting raids."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    """Ban owners whose posts expired 4+ hours ago with raids still awaiting their confirmation.
+
+    Set-based and incremental: one UPDATE bans every affected owner, and only posts whose
+    expires_at falls after the last run's watermark are considered, all in one transaction.
+    """
+    now = now_ts()
+    cutoff = now - BAN_GRACE
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        "SELECT value FROM job_state WHERE name = 'ban_sweep_watermark'"
+    ).fetchone()
+    watermark = row[0] if row else 0
 
-    # Find expired posts older than 4 hours where no confirmation has been made
-    cutoff = datetime.utcnow() - timedelta(hours=4)
-    rows = c.execute("""
-        SELECT p.telegram_id, p.id
-        FROM posts p
-        WHERE p.status = 'expired'
-        AND p.expires_at <= ?
-        AND EXISTS (
-            SELECT 1 FROM verifications v
-            WHERE v.post_id = p.id
-            AND v.status = 'pending'
+    banned = conn.execute("""
+        UPDATE users
+        SET post_ban_until = MAX(IFNULL(post_ban_until, 0), ?)
+        WHERE telegram_id IN (
+            SELECT p.telegram_id
+            FROM posts p
+            WHERE p.expires_at > ? AND p.expires_at <= ?
+            AND EXISTS (
+                SELECT 1 FROM verifications v
+                WHERE v.post_id = p.id
+                AND v.status = 'pending'
+            )
         )
-    """, (cutoff,)).fetchall()
-
-    for user_id, post_id in rows:
-        # Ban user for 48 hours
-        banned_until = datetime.utcnow() + timedelta(hours=48)
-        c.execute("""
-            UPDATE users
-            SET banned_until = ?
-            WHERE telegram_id = ?
-        """, (banned_until.isoformat(), user_id))
-        print(
-            f"🚫 Banned user {user_id} for 48h due to inactivity on post {post_id}")
+    """, (now + BAN_DURATION, watermark, cutoff)).rowcount
 
+    conn.execute("""
+        INSERT OR REPLACE INTO job_state (name, value)
+        VALUES ('ban_sweep_watermark', ?)
+    """, (cutoff,))
     conn.commit()
     conn.close()
 
+    if banned:
+        print(f"🚫 Banned {banned} user(s) for 48h due to unreviewed raids.")
+    return banned
+
 # ───── Profile Stats ─────────────────────────────────────
 
 
 def get_user_stats(telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     approved, rejected, task_slots, ref_slots = conn.execute("""
         SELECT
             (SELECT COUNT(*) FROM posts WHERE telegram_id = ? AND status = 'approved'),
-            (SELECT COUNT(*) FROM posts WHERE telegram_id = ? AND status = 'rejected'),
-            (SELECT IFNULL(SUM(slots), 0) FROM slot_logs WHERE telegram_id = ? AND reason = 'task'),
+            (SELECT COUNT(*) FROM posts WHERE telegram_id = ? AND status = 'rejected')
+                + IFNULL(a.posts_rejected, 0),
+            (SELECT IFNULL(SUM(slots), 0) FROM slot_logs WHERE telegram_id = ? AND reason = 'task')
+                + IFNULL(a.task_slots, 0),
             (SELECT IFNULL(SUM(slots), 0) FROM slot_logs WHERE telegram_id = ? AND reason = 'referral')
-    """, (telegram_id, telegram_id, telegram_id, telegram_id)).fetchone()
+                + IFNULL(a.referral_slots, 0)
+        FROM (SELECT 1) LEFT JOIN archived_user_totals a ON a.telegram_id = ?
+    """, (telegram_id, telegram_id, telegram_id, telegram_id, telegram_id)).fetchone()
     conn.close()
     return approved, rejected, task_slots, ref_slots
 
@@ -564,74 +1379,856 @@ def get_user_stats(telegram_id: int):
 
 
 def expire_old_posts():
-    cutoff = datetime.utcnow() - timedelta(hours=24)
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     conn.execute("""
         UPDATE posts
         SET status = 'expired'
-        WHERE status = 'approved' AND approved_at IS NOT NULL AND approved_at <= ?
-    """, (cutoff,))
+        WHERE status = 'approved' AND expires_at <= ?
+    """, (now_ts(),))
     conn.commit()
     conn.close()
     print("🕒 Expired old approved posts.")
 
 
 def update_verification_status(post_id: int, doer_id: int, status: str):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         UPDATE verifications
-        SET confirmed = ?, responded = 1, updated_at = CURRENT_TIMESTAMP
+        SET status = ?, confirmed = ?, responded = 1, updated_at = ?
         WHERE post_id = ? AND doer_id = ?
-    """, (1 if status == "confirmed" else 0, post_id, doer_id))
+    """, (status, 1 if status == "confirmed" else 0, now_ts(), post_id, doer_id))
     conn.commit()
     conn.close()
 
 
-def get_expired_unconfirmed_verifications():
-    cutoff = datetime.utcnow() - timedelta(hours=28)
-    conn = sqlite3.connect(DB_FILE)
-    rows = conn.execute("""
-        SELECT DISTINCT v.owner_id
-        FROM verifications v
-        JOIN posts p ON v.post_id = p.id
-        WHERE v.responded = 0
-        AND p.status = 'expired'
-        AND p.approved_at <= ?
-    """, (cutoff,)).fetchall()
-    conn.close()
-    return [row[0] for row in rows]
-
-
 def ban_user_from_posting(telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     c = conn.cursor()
     c.execute("""
         UPDATE users
-        SET post_ban_until = datetime('now', '+48 hours')
+        SET post_ban_until = ?
         WHERE telegram_id = ?
-    """, (telegram_id,))
+    """, (now_ts() + BAN_DURATION, telegram_id))
     conn.commit()
     conn.close()
 
 
-def get_verifications_for_post(post_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    rows = conn.execute("""
-        SELECT v.doer_id, u.name, u.twitter_handle, v.status
-        FROM verifications v
+def iter_verifications_for_post(post_id: int):
+    return _iter_keyset(
+        RaidVerification,
+        "v.doer_id, u.name, u.twitter_handle, v.status",
+        """
+        verifications v
         JOIN users u ON u.telegram_id = v.doer_id
         WHERE v.post_id = ?
-    """, (post_id,)).fetchall()
+        """,
+        (post_id,),
+        keyset=("v.id",),
+    )
+
+
+def get_verifications_for_post(post_id: int):
+    return list(iter_verifications_for_post(post_id))
+
+
+# ───── Notification Outbox ───────────────────────────────
+# Any process (bot, scheduler thread, auth_server) queues messages here inside the same
+# transaction as the state change they announce; the bot's drainer delivers them.
+
+
+def enqueue_notification(conn, chat_id: int, text: str, parse_mode: str = None,
+                         reply_markup: dict = None):
+    """Queue a message on the caller's connection; it is only visible once the caller commits."""
+    now = now_ts()
+    conn.execute("""
+        INSERT INTO outbox (chat_id, text, parse_mode, reply_markup, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (chat_id, text, parse_mode, json.dumps(reply_markup) if reply_markup else None, now, now))
+
+
+def get_due_notifications(limit: int = 50):
+    """Oldest pending messages whose next attempt is due: (id, chat_id, text, parse_mode, reply_markup, attempts)."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT id, chat_id, text, parse_mode, reply_markup, attempts
+        FROM outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at, id
+        LIMIT ?
+    """, (now_ts(), limit)).fetchall()
     conn.close()
-    return rows
+    return [
+        (row_id, chat_id, text, parse_mode, json.loads(markup) if markup else None, attempts)
+        for row_id, chat_id, text, parse_mode, markup, attempts in rows
+    ]
+
+
+def mark_notifications_sent(ids):
+    now = now_ts()
+    conn = connect()
+    conn.executemany(
+        "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+        [(now, row_id) for row_id in ids]
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_notification_failed(row_id: int, error: str, retry_in: int = None, final: bool = False):
+    """Record a failed attempt; retries with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+
+    `retry_in` overrides the backoff (e.g. Telegram's flood-control delay) and does not
+    count as an attempt; `final` gives up straight away (e.g. the user blocked the bot).
+    """
+    conn = connect()
+    if retry_in is not None:
+        conn.execute(
+            "UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (now_ts() + retry_in, error, row_id)
+        )
+    else:
+        conn.execute("""
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                next_attempt_at = ? + (30 << attempts),
+                status = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+            WHERE id = ?
+        """, (error, now_ts(), final, OUTBOX_MAX_ATTEMPTS, row_id))
+    conn.commit()
+    conn.close()
+
+
+def purge_sent_notifications(older_than: int = 7 * 24 * 3600):
+    conn = connect()
+    conn.execute(
+        "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?", (now_ts() - older_than,)
+    )
+    conn.commit()
+    conn.close()
+
+# ───── Unreachable Chats ─────────────────────────────────
+# Chats that blocked the bot or no longer exist; sends skip them until the user comes back.
+
+
+def get_unreachable_chat_ids() -> set[int]:
+    conn = connect()
+    rows = conn.execute("SELECT chat_id FROM unreachable_chats").fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+
+def mark_chat_unreachable(chat_id: int, reason: str):
+    conn = connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO unreachable_chats (chat_id, reason, marked_at) VALUES (?, ?, ?)",
+        (chat_id, reason, now_ts())
+    )
+    conn.commit()
+    conn.close()
+
+
+def clear_chat_unreachable(chat_id: int):
+    conn = connect()
+    conn.execute("DELETE FROM unreachable_chats WHERE chat_id = ?", (chat_id,))
+    conn.commit()
+    conn.close()
+
+# ───── Digests ───────────────────────────────────────────
+# Users with a digest_prefs row get raid/follow events buffered in digest_events and
+# delivered as one summary through the outbox instead of one DM per event.
+
+
+def set_digest_mode(telegram_id: int, interval_seconds: int = None, max_events: int = None):
+    """Enable digests with the given interval and size threshold, or disable with None."""
+    conn = connect()
+    if interval_seconds is None:
+        conn.execute("DELETE FROM digest_prefs WHERE telegram_id = ?", (telegram_id,))
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO digest_prefs (telegram_id, interval_seconds, max_events) VALUES (?, ?, ?)",
+            (telegram_id, interval_seconds, max_events)
+        )
+    conn.commit()
+    conn.close()
+
+
+def get_digest_prefs(telegram_id: int):
+    """(interval_seconds, max_events), or None if the user gets events as they happen."""
+    conn = connect()
+    row = conn.execute(
+        "SELECT interval_seconds, max_events FROM digest_prefs WHERE telegram_id = ?", (telegram_id,)
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def buffer_digest_event(recipient_id: int, kind: str, actor_id: int, actor_name: str,
+                        post_id: int = None) -> bool | None:
+    """Buffer an event for a digest user.
+
+    Returns None if the recipient is not in digest mode (send the DM as usual), otherwise
+    whether the buffer has reached the recipient's size threshold.
+    """
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    prefs = conn.execute(
+        "SELECT max_events FROM digest_prefs WHERE telegram_id = ?", (recipient_id,)
+    ).fetchone()
+    if not prefs:
+        conn.rollback()
+        conn.close()
+        return None
+    conn.execute("""
+        INSERT INTO digest_events (recipient_id, kind, actor_id, actor_name, post_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (recipient_id, kind, actor_id, actor_name, post_id, now_ts()))
+    count = conn.execute(
+        "SELECT COUNT(*) FROM digest_events WHERE recipient_id = ?", (recipient_id,)
+    ).fetchone()[0]
+    conn.commit()
+    conn.close()
+    return count >= prefs[0]
+
+
+def get_due_digest_recipients() -> list[int]:
+    """Recipients whose oldest buffered event has waited their full interval, or who no
+    longer have digests enabled but still have events buffered."""
+    now = now_ts()
+    conn = connect()
+    rows = conn.execute("""
+        SELECT e.recipient_id
+        FROM digest_events e
+        LEFT JOIN digest_prefs p ON p.telegram_id = e.recipient_id
+        GROUP BY e.recipient_id
+        HAVING p.telegram_id IS NULL OR MIN(e.created_at) <= ? - MIN(p.interval_seconds)
+    """, (now,)).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def flush_digest(recipient_id: int, render) -> int:
+    """Replace a recipient's buffered events with one outbox message, atomically.
+
+    `render(events)` gets [(kind, actor_id, actor_name, post_id, created_at)] and returns
+    (text, reply_markup dict or None). Returns the number of events flushed.
+    """
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute("""
+        SELECT id, kind, actor_id, actor_name, post_id, created_at
+        FROM digest_events WHERE recipient_id = ? ORDER BY id
+    """, (recipient_id,)).fetchall()
+    if rows:
+        text, reply_markup = render([row[1:] for row in rows])
+        enqueue_notification(conn, recipient_id, text, reply_markup=reply_markup)
+        conn.execute(
+            "DELETE FROM digest_events WHERE recipient_id = ? AND id <= ?", (recipient_id, rows[-1][0])
+        )
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+# ───── Broadcasts ────────────────────────────────────────
+# A campaign walks users in telegram_id order; last_user_id is the resume checkpoint.
+
+
+def create_broadcast(text: str, created_by: int, parse_mode: str = None) -> int:
+    conn = connect()
+    total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    cur = conn.execute("""
+        INSERT INTO broadcasts (text, parse_mode, created_by, total, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (text, parse_mode, created_by, total, now_ts()))
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
 
 
+def get_broadcast(broadcast_id: int):
+    """(id, text, parse_mode, created_by, status, last_user_id, total, sent, failed, created_at)"""
+    conn = connect()
+    row = conn.execute("""
+        SELECT id, text, parse_mode, created_by, status, last_user_id, total, sent, failed, created_at
+        FROM broadcasts WHERE id = ?
+    """, (broadcast_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def get_running_broadcast_ids() -> list[int]:
+    conn = connect()
+    rows = conn.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id").fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_user_ids_after(last_user_id: int, limit: int) -> list[int]:
+    """Keyset page of recipients: one index range scan on the users primary key per page."""
+    conn = connect()
+    rows = conn.execute(
+        "SELECT telegram_id FROM users WHERE telegram_id > ? ORDER BY telegram_id LIMIT ?",
+        (last_user_id, limit)
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def checkpoint_broadcast(broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                         status: str = "running"):
+    """Advance the checkpoint past a finished page and add its counts."""
+    conn = connect()
+    conn.execute("""
+        UPDATE broadcasts
+        SET last_user_id = ?, sent = sent + ?, failed = failed + ?, status = ?,
+            finished_at = CASE WHEN ? = 'running' THEN NULL ELSE ? END
+        WHERE id = ? AND status = 'running'
+    """, (last_user_id, sent, failed, status, status, now_ts(), broadcast_id))
+    conn.commit()
+    conn.close()
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    conn = connect()
+    cur = conn.execute("""
+        UPDATE broadcasts SET status = 'cancelled', finished_at = ?
+        WHERE id = ? AND status = 'running'
+    """, (now_ts(), broadcast_id))
+    conn.commit()
+    conn.close()
+    return cur.rowcount > 0
+
+# ───── Archive ───────────────────────────────────────────
+# Finished posts older than archive.ARCHIVE_AFTER_DAYS move, with their completions and
+# verifications, from main into the attached archive database; so do old slot logs. Every
+# hot query only looks at the last day or so and never attaches the archive. History-wide
+# stats add archived_user_totals; exports read the all_<table> views over both.
+#
+# A move is two transactions: copy into the archive, then delete from main. SQLite only
+# commits across attached databases atomically in rollback-journal mode, not under WAL, so
+# the copy is an INSERT OR IGNORE: after a crash between the two, rows exist in both places
+# (the views may show them twice) until the next batch re-copies nothing and deletes them.
+# Only rows already in the archive are deleted, so none can go missing from both.
+
+ARCHIVED_TABLES = ("posts", "completions", "verifications", "slot_logs")
+ARCHIVED_TOTALS = ("posts_rejected", "raids_confirmed", "task_slots", "referral_slots")
+
+
+def archive_target() -> str:
+    if ARCHIVE_DB:
+        return ARCHIVE_DB
+    if DB_FILE == ":memory:":
+        return ARCHIVE_MEMORY_URI
+    path, sep, query = DB_FILE.partition("?")
+    root, ext = os.path.splitext(path)
+    return f"{root}_archive{ext or '.db'}{sep}{query}"
+
+
+def _table_columns(conn, table: str, schema: str = "main") -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _ensure_archive_table(conn, table: str) -> list[str]:
+    """Create archive.<table> from main's definition, or add columns main has gained since."""
+    columns = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+    existing = set(_table_columns(conn, table, "archive"))
+    if not existing:
+        sql = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        conn.execute(re.sub(r"^CREATE TABLE (IF NOT EXISTS )?", "CREATE TABLE IF NOT EXISTS archive.", sql))
+    else:
+        for _, name, decl, *_ in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {decl}")
+    return [column[1] for column in columns]
+
+
+def _attach_archive(conn: sqlite3.Connection) -> sqlite3.Connection:
+    global _archive_anchor
+    target = archive_target()
+    if target == ARCHIVE_MEMORY_URI and _archive_anchor is None:
+        _archive_anchor = sqlite3.connect(target, uri=True, check_same_thread=False)
+    conn.execute("ATTACH DATABASE ? AS archive", (target,))
+    return conn
+
+
+def ensure_archive_schema():
+    """Create or extend the archive's tables to match main; run by init_db after migrations."""
+    conn = _attach_archive(connect())
+    for table in ARCHIVED_TABLES:
+        _archive_columns[table] = _ensure_archive_table(conn, table)
+    conn.close()
+
+
+def connect_with_archive() -> sqlite3.Connection:
+    """A connection with the archive attached as `archive` and a TEMP view all_<table>
+    (main UNION ALL archive) for each archived table."""
+    if not _archive_columns:
+        ensure_archive_schema()
+    conn = _attach_archive(connect())
+    for table, columns in _archive_columns.items():
+        columns = ", ".join(columns)
+        conn.execute(f"""
+            CREATE TEMP VIEW IF NOT EXISTS all_{table} AS
+            SELECT {columns} FROM main.{table} UNION ALL SELECT {columns} FROM archive.{table}
+        """)
+    return conn
+
+
+def _add_archived_totals(conn, select: str, params):
+    """Fold `select` rows of (telegram_id, *ARCHIVED_TOTALS) into archived_user_totals."""
+    columns = ", ".join(ARCHIVED_TOTALS)
+    conn.execute(f"""
+        INSERT INTO archived_user_totals (telegram_id, {columns})
+        {select}
+        ON CONFLICT(telegram_id) DO UPDATE SET
+        {', '.join(f'{c} = {c} + excluded.{c}' for c in ARCHIVED_TOTALS)}
+    """, params)
+
+
+def _copy_rows(conn, table: str, where: str, params):
+    columns = ", ".join(_archive_columns[table])
+    conn.execute(f"""
+        INSERT OR IGNORE INTO archive.{table} ({columns})
+        SELECT {columns} FROM main.{table} WHERE {where}
+    """, params)
+
+
+def _advance_archive_cutoff(conn, cutoff: int):
+    conn.execute("""
+        INSERT INTO job_state (name, value) VALUES ('archive_cutoff', ?)
+        ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)
+    """, (cutoff,))
+
+
+def archive_posts_batch(cutoff: int, limit: int = 500) -> int:
+    """Move up to `limit` expired or rejected posts from before `cutoff`, with their
+    completions and verifications, to the archive. Returns posts moved."""
+    conn = connect_with_archive()
+    conn.execute("BEGIN IMMEDIATE")
+    ids = [row[0] for row in conn.execute("""
+        SELECT id FROM main.posts
+        WHERE (status = 'expired' AND expires_at < ?) OR (status = 'rejected' AND submitted_at < ?)
+        ORDER BY id LIMIT ?
+    """, (cutoff, cutoff, limit))]
+    if ids:
+        marks = ", ".join("?" * len(ids))
+        for table, key in (("completions", "post_id"), ("verifications", "post_id"), ("posts", "id")):
+            _copy_rows(conn, table, f"{key} IN ({marks})", ids)
+        conn.commit()
+
+        # Totals are folded in with the delete, so each row is counted exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        _add_archived_totals(conn, f"""
+            SELECT telegram_id, COUNT(*), 0, 0, 0
+            FROM main.posts WHERE status = 'rejected' AND id IN ({marks})
+            AND id IN (SELECT id FROM archive.posts) GROUP BY telegram_id
+        """, ids)
+        _add_archived_totals(conn, f"""
+            SELECT doer_id, 0, COUNT(*), 0, 0
+            FROM main.verifications WHERE status = 'confirmed' AND post_id IN ({marks})
+            AND id IN (SELECT id FROM archive.verifications) GROUP BY doer_id
+        """, ids)
+        for table, key in (("completions", "post_id"), ("verifications", "post_id"), ("posts", "id")):
+            conn.execute(f"""
+                DELETE FROM main.{table}
+                WHERE {key} IN ({marks}) AND id IN (SELECT id FROM archive.{table})
+            """, ids)
+        _advance_archive_cutoff(conn, cutoff)
+    conn.commit()
+    conn.close()
+    return len(ids)
+
+
+def archive_slot_logs_batch(cutoff: int, limit: int = 500) -> int:
+    """Move up to `limit` slot logs from before `cutoff` to the archive. Returns rows moved."""
+    conn = connect_with_archive()
+    conn.execute("BEGIN IMMEDIATE")
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM main.slot_logs WHERE created_at < ? ORDER BY id LIMIT ?", (cutoff, limit)
+    )]
+    if ids:
+        marks = ", ".join("?" * len(ids))
+        _copy_rows(conn, "slot_logs", f"id IN ({marks})", ids)
+        conn.commit()
+
+        conn.execute("BEGIN IMMEDIATE")
+        _add_archived_totals(conn, f"""
+            SELECT telegram_id, 0, 0,
+                   SUM(CASE WHEN reason = 'task' THEN slots ELSE 0 END),
+                   SUM(CASE WHEN reason = 'referral' THEN slots ELSE 0 END)
+            FROM main.slot_logs WHERE id IN ({marks})
+            AND id IN (SELECT id FROM archive.slot_logs) GROUP BY telegram_id
+        """, ids)
+        conn.execute(f"""
+            DELETE FROM main.slot_logs
+            WHERE id IN ({marks}) AND id IN (SELECT id FROM archive.slot_logs)
+        """, ids)
+        _advance_archive_cutoff(conn, cutoff)
+    conn.commit()
+    conn.close()
+    return len(ids)
+
+
+def get_archive_cutoff() -> int | None:
+    """Everything archived so far is older than this; None if nothing has been archived."""
+    conn = connect()
+    row = conn.execute("SELECT value FROM job_state WHERE name = 'archive_cutoff'").fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def get_archive_status() -> dict:
+    """{table: (hot rows, archived rows)} plus both databases' sizes in bytes."""
+    conn = connect_with_archive()
+    status = {
+        table: (
+            conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0],
+            conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0],
+        )
+        for table in ARCHIVED_TABLES
+    }
+    for schema in ("main", "archive"):
+        pages = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        status[f"{schema}_bytes"] = pages * conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    conn.close()
+    return status
+
+# ───── Maintenance ───────────────────────────────────────
+# Steps for maintenance.py. Each takes a monotonic `deadline`: lock waits are capped to the
+# time left and SQLite's progress handler aborts a statement still running when it passes,
+# so no step holds the database, or waits on it, for longer.
+
+ANALYSIS_LIMIT = 1000  # rows sampled per index by ANALYZE; plenty for the planner
+
+
+def _guarded(deadline: float) -> sqlite3.Connection:
+    conn = connect()
+    conn.execute(f"PRAGMA busy_timeout = {max(int((deadline - time.monotonic()) * 1000), 0)}")
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+    return conn
+
+
+def _timed_out(error: sqlite3.OperationalError) -> bool:
+    return "interrupted" in str(error) or "locked" in str(error) or "busy" in str(error)
+
+
+def get_storage_stats() -> dict:
+    conn = connect()
+    stats = {
+        pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in ("page_size", "page_count", "freelist_count", "auto_vacuum", "journal_mode")
+    }
+    stats["has_statistics"] = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone() is not None
+    conn.close()
+    stats["db_bytes"] = stats["page_size"] * stats["page_count"]
+    stats["free_bytes"] = stats["page_size"] * stats["freelist_count"]
+    on_disk = not _db_is_uri and DB_FILE != ":memory:"
+    wal_path = f"{DB_FILE}-wal"
+    stats["wal_bytes"] = os.path.getsize(wal_path) if on_disk and os.path.exists(wal_path) else 0
+    archive = archive_target()
+    stats["archive_bytes"] = (
+        os.path.getsize(archive) if not archive.startswith("file:") and os.path.exists(archive) else 0
+    )
+    return stats
+
+
+def analyze_db(deadline: float, full: bool = False) -> bool:
+    """PRAGMA optimize, or a sampled ANALYZE of everything when `full`. False if cut short."""
+    conn = _guarded(deadline)
+    try:
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE" if full else "PRAGMA optimize")
+        conn.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        if not _timed_out(e):
+            raise
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def incremental_vacuum_step(pages: int, deadline: float) -> int:
+    """Return up to `pages` free pages to the filesystem; returns how many were freed."""
+    conn = _guarded(deadline)
+    try:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()  # a page per row
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    except sqlite3.OperationalError as e:
+        if not _timed_out(e):
+            raise
+        return 0
+    finally:
+        conn.close()
+
+
+def enable_incremental_vacuum():
+    """Switch an existing database to auto_vacuum=INCREMENTAL; needs one full VACUUM, so it
+    rewrites the whole file and is never time-boxed."""
+    conn = connect()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def checkpoint_wal(mode: str, deadline: float):
+    """Checkpoint the WAL; returns (busy, wal frames, frames checkpointed), None when the
+    database isn't in WAL mode and there is nothing to checkpoint, or False if cut short."""
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    conn = _guarded(deadline)
+    try:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            return None
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    except sqlite3.OperationalError as e:
+        if not _timed_out(e):
+            raise
+        return False
+    finally:
+        conn.close()
+
+# ───── Exports ───────────────────────────────────────────
+
+# table -> (date column used for range filters, exported columns)
+EXPORT_TABLES = {
+    "posts": ("submitted_at", ("id", "telegram_id", "post_link", "tweet_id", "group_id", "status",
+                               "submitted_at", "approved_at", "expires_at")),
+    "completions": ("created_at", ("id", "telegram_id", "post_id", "created_at")),
+    "verifications": ("created_at", ("id", "post_id", "doer_id", "owner_id", "status",
+                                     "created_at", "updated_at")),
+    "slot_logs": ("created_at", ("id", "telegram_id", "slots", "reason", "note", "created_at")),
+    "follow_actions": ("created_at", ("id", "follower_id", "followed_id", "confirmed", "responded",
+                                      "created_at")),
+}
+
+
+def iter_export_chunks(table: str, start: int = None, end: int = None,
+                       page_size: int = 50_000, chunk_size: int = 5_000, columns=None):
+    """Yield lists of up to `chunk_size` rows of `table` with start <= date < end, in id order.
+
+    `columns` narrows the exported columns; "id" is always selected first. Archived rows
+    are included (through the all_<table> view) whenever the range reaches back before the
+    archive cutoff.
+
+    Pages are fetched by keyset (id > last id) on a fresh connection each, so no read
+    transaction stays open for the whole export, and rows are pulled with fetchmany so
+    memory stays bounded however large the table is.
+    """
+    date_column, exported = EXPORT_TABLES[table]
+    if columns is None:
+        columns = exported
+    else:
+        if not set(columns) <= set(exported):
+            raise ValueError(f"Not exported from {table}: {sorted(set(columns) - set(exported))}")
+        columns = ("id", *(c for c in columns if c != "id"))
+    archive_cutoff = get_archive_cutoff() if table in ARCHIVED_TABLES else None
+    archived = archive_cutoff is not None and (start is None or start < archive_cutoff)
+    opener, source = (connect_with_archive, f"all_{table}") if archived else (connect, table)
+    query = f"SELECT {', '.join(columns)} FROM {source} WHERE id > ?"
+    params = []
+    if start is not None:
+        query += f" AND {date_column} >= ?"
+        params.append(start)
+    if end is not None:
+        query += f" AND {date_column} < ?"
+        params.append(end)
+    query += " ORDER BY id LIMIT ?"
+
+    last_id = 0
+    while True:
+        conn = opener()
+        try:
+            cur = conn.execute(query, (last_id, *params, page_size))
+            fetched = 0
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                fetched += len(rows)
+                last_id = rows[-1][0]
+                yield rows
+        finally:
+            conn.close()
+        if fetched < page_size:
+            return
+
 # ───── Admin Dashboard ───────────────────────────────────
 
+ROLLUP_BACKFILL_HOURS = 90 * 24  # history rolled up the first time the job runs
+
+# stats_hourly column -> per-hour aggregate over [?, ?); each is one indexed range scan
+ROLLUP_QUERIES = {
+    "posts_submitted": "SELECT submitted_at / 3600, COUNT(*) FROM posts "
+                       "WHERE submitted_at >= ? AND submitted_at < ? GROUP BY 1",
+    "posts_approved": "SELECT approved_at / 3600, COUNT(*) FROM posts "
+                      "WHERE approved_at >= ? AND approved_at < ? GROUP BY 1",
+    "posts_expired": "SELECT expires_at / 3600, COUNT(*) FROM posts "
+                     "WHERE expires_at >= ? AND expires_at < ? AND status IN ('approved', 'expired') GROUP BY 1",
+    "completions": "SELECT created_at / 3600, COUNT(*) FROM completions "
+                   "WHERE created_at >= ? AND created_at < ? GROUP BY 1",
+    "verifications_confirmed": "SELECT updated_at / 3600, COUNT(*) FROM verifications "
+                               "WHERE updated_at >= ? AND updated_at < ? AND status = 'confirmed' GROUP BY 1",
+    "slots_earned": "SELECT created_at / 3600, SUM(slots) FROM slot_logs "
+                    "WHERE created_at >= ? AND created_at < ? AND slots > 0 GROUP BY 1",
+    "slots_spent": "SELECT created_at / 3600, -SUM(slots) FROM slot_logs "
+                   "WHERE created_at >= ? AND created_at < ? AND slots < 0 GROUP BY 1",
+    "new_users": "SELECT created_at / 3600, COUNT(*) FROM users "
+                 "WHERE created_at >= ? AND created_at < ? GROUP BY 1",
+    "follow_actions": "SELECT created_at / 3600, COUNT(*) FROM follow_actions "
+                      "WHERE created_at >= ? AND created_at < ? GROUP BY 1",
+}
+
+
+def refresh_hourly_rollups() -> int:
+    """Bring stats_hourly up to date; returns how many hours were (re)written.
+
+    Only hours from the watermark onwards are recomputed: closed hours never change, and
+    the current hour is rewritten on every run until it closes.
+    """
+    now = now_ts()
+    current_hour = now // 3600
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        "SELECT value FROM job_state WHERE name = 'stats_rollup_hour'"
+    ).fetchone()
+    start_hour = row[0] if row else current_hour - ROLLUP_BACKFILL_HOURS
+
+    hours = {hour: dict.fromkeys(ROLLUP_QUERIES, 0) for hour in range(start_hour, current_hour + 1)}
+    for column, query in ROLLUP_QUERIES.items():
+        # Capped at now: expiries are scheduled ahead and must not count early
+        for hour, value in conn.execute(query, (start_hour * 3600, now + 1)):
+            if hour in hours:
+                hours[hour][column] = value
+
+    columns = list(ROLLUP_QUERIES)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO stats_hourly (hour, {', '.join(columns)}) "
+        f"VALUES (?{', ?' * len(columns)})",
+        [(hour, *(values[c] for c in columns)) for hour, values in hours.items()]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO job_state (name, value) VALUES ('stats_rollup_hour', ?)",
+        (current_hour,)
+    )
+    conn.commit()
+    conn.close()
+    return len(hours)
+
+
+def get_rollup_totals(since_hour: int) -> dict:
+    """Sum of every stats_hourly column from `since_hour` on."""
+    columns = list(ROLLUP_QUERIES)
+    conn = connect()
+    row = conn.execute(
+        f"SELECT {', '.join(f'IFNULL(SUM({c}), 0)' for c in columns)} FROM stats_hourly WHERE hour >= ?",
+        (since_hour,)
+    ).fetchone()
+    conn.close()
+    return dict(zip(columns, row))
+
+
+def get_rollup_series(column: str, since_hour: int) -> list[tuple[int, float]]:
+    if column not in ROLLUP_QUERIES:
+        raise ValueError(f"Unknown rollup column: {column}")
+    conn = connect()
+    rows = conn.execute(
+        f"SELECT hour, {column} FROM stats_hourly WHERE hour >= ? ORDER BY hour", (since_hour,)
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def get_dashboard_gauges() -> dict:
+    """Point-in-time counts that rollups can't answer (pending posts: get_pending_count)."""
+    conn = connect()
+    users, live, outbox = conn.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM users),
+            (SELECT COUNT(*) FROM posts WHERE status = 'approved' AND expires_at > ?),
+            (SELECT COUNT(*) FROM outbox WHERE status = 'pending')
+    """, (now_ts(),)).fetchone()
+    conn.close()
+    return {"users": users, "live_raids": live, "outbox_pending": outbox}
+
+# ───── Engagement Analytics ──────────────────────────────
+
+ENGAGEMENT_COLUMNS = (
+    "raids_done", "raids_received", "raids_confirmed", "raids_rejected", "confirmation_rate",
+    "follows_given", "follow_backs", "reciprocity", "slots_earned", "slots_spent", "slot_velocity"
+)
+
+
+def replace_engagement_weeks(since_week: int, rows) -> int:
+    """Swap in freshly computed engagement rows for every week from `since_week` on.
+
+    `rows` are (week_start, telegram_id, *ENGAGEMENT_COLUMNS) tuples; readers see either the
+    old weeks or the new ones, never a mix.
+    """
+    now = now_ts()
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM engagement_weekly WHERE week_start >= ?", (since_week,))
+    cur = conn.executemany(f"""
+        INSERT INTO engagement_weekly (week_start, telegram_id, {', '.join(ENGAGEMENT_COLUMNS)}, computed_at)
+        VALUES ({', '.join('?' * (len(ENGAGEMENT_COLUMNS) + 2))}, ?)
+    """, (tuple(row) + (now,) for row in rows))
+    conn.commit()
+    conn.close()
+    return cur.rowcount
+
+
+def get_latest_engagement_week() -> int | None:
+    conn = connect()
+    week = conn.execute("SELECT MAX(week_start) FROM engagement_weekly").fetchone()[0]
+    conn.close()
+    return week
+
+
+def get_engagement_summary(week_start: int) -> dict:
+    """Totals across all users for one week; rates are pooled, not averaged per user."""
+    conn = connect()
+    row = conn.execute("""
+        SELECT COUNT(*), IFNULL(SUM(raids_done), 0), IFNULL(SUM(raids_confirmed), 0),
+               IFNULL(SUM(raids_rejected), 0), IFNULL(SUM(follows_given), 0),
+               IFNULL(SUM(follow_backs), 0), IFNULL(SUM(slots_earned), 0),
+               IFNULL(SUM(slots_spent), 0), MAX(computed_at)
+        FROM engagement_weekly WHERE week_start = ?
+    """, (week_start,)).fetchone()
+    conn.close()
+    keys = ("users", "raids_done", "raids_confirmed", "raids_rejected", "follows_given",
+            "follow_backs", "slots_earned", "slots_spent", "computed_at")
+    return dict(zip(keys, row))
+
+
+def get_top_engaged(week_start: int, limit: int = 5) -> list[tuple]:
+    """(name, raids_done, confirmation_rate, reciprocity, slot_velocity) by raids done."""
+    conn = connect()
+    rows = conn.execute("""
+        SELECT IFNULL(u.name, e.telegram_id), e.raids_done, e.confirmation_rate, e.reciprocity,
+               e.slot_velocity
+        FROM engagement_weekly e
+        LEFT JOIN users u ON u.telegram_id = e.telegram_id
+        WHERE e.week_start = ?
+        ORDER BY e.raids_done DESC, e.slots_earned DESC
+        LIMIT ?
+    """, (week_start, limit)).fetchall()
+    conn.close()
+    return rows
+
 
 def get_pending_count():
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect()
     count = conn.execute(
         "SELECT COUNT(*) FROM posts WHERE status = 'pending'"
     ).fetchone()[0]
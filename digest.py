@@ -0,0 +1,51 @@
+from collections import Counter
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from db import buffer_digest_event, flush_digest, get_due_digest_recipients
+
+DEFAULT_DIGEST_INTERVAL = 60 * 60  # seconds between digests
+MAX_DIGEST_INTERVAL = 3 * 60 * 60  # owners must still see raids well inside BAN_GRACE
+DIGEST_MAX_EVENTS = 25  # a digest goes out early once this many events are buffered
+DIGEST_BUTTON_LIMIT = 5  # posts with their own Review button
+
+
+def render_digest(events):
+    """One summary message, with inline actions, for a batch of buffered events."""
+    raids = Counter(post_id for kind, _, _, post_id, _ in events if kind == "raid")
+    followers = [actor_name for kind, _, actor_name, _, _ in events if kind == "follow"]
+
+    lines = [f"🗞 Digest: {len(events)} update(s) since the last one\n"]
+    buttons = []
+    if raids:
+        lines.append(f"📣 {sum(raids.values())} raid completion(s) waiting for your review:")
+        for post_id, count in raids.most_common():
+            lines.append(f"• Post #{post_id}: {count} raider(s)")
+        for post_id, count in raids.most_common(DIGEST_BUTTON_LIMIT):
+            buttons.append([InlineKeyboardButton(
+                f"👀 Review post #{post_id} ({count})", callback_data=f"responses|{post_id}")])
+    if followers:
+        shown = ", ".join(followers[:10])
+        more = f" and {len(followers) - 10} more" if len(followers) > 10 else ""
+        lines.append(f"\n👥 {len(followers)} user(s) say they followed you: {shown}{more}")
+        buttons.append([InlineKeyboardButton("📥 Review followers", callback_data="pendingfollowers")])
+
+    markup = InlineKeyboardMarkup(buttons).to_dict() if buttons else None
+    return "\n".join(lines), markup
+
+
+def queue_digest_event(recipient_id: int, kind: str, actor_id: int, actor_name: str,
+                       post_id: int = None) -> bool:
+    """Buffer an event for a digest user; returns False if the caller should DM as usual."""
+    full = buffer_digest_event(recipient_id, kind, actor_id, actor_name, post_id)
+    if full is None:
+        return False
+    if full:
+        flush_digest(recipient_id, render_digest)
+    return True
+
+
+async def digest_job(context):
+    """Job: turn every due digest into an outbox message."""
+    for recipient_id in get_due_digest_recipients():
+        flush_digest(recipient_id, render_digest)
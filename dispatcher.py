@@ -0,0 +1,92 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+MAX_WORKERS = 16  # handlers running at once across all users
+MAX_IN_FLIGHT = 10_000  # updates accepted (waiting + running) before new ones block
+
+
+def update_key(update: object):
+    """Ordering key: the user if there is one, otherwise the chat. None means unordered."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across users but strictly in arrival order per user.
+
+    Each key (user or chat) has a chain of futures; an update waits for the previous update
+    of the same key to finish before it takes one of `max_workers` worker slots, so a user
+    with a backlog never holds more than one slot. Flows such as awaiting_post keep their
+    per-user ordering while a slow API call for one user no longer delays everyone else.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_in_flight: int = MAX_IN_FLIGHT):
+        super().__init__(max_in_flight)
+        self.max_workers = max_workers
+        self._workers = None
+        self._tails = {}
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.peak_waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Updates accepted but not yet running."""
+        return self.waiting
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "processed": self.processed,
+            "peak_waiting": self.peak_waiting,
+            "active_keys": len(self._tails),
+            "workers": self.max_workers,
+        }
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        previous = None
+        done = None
+        if key is not None:
+            previous = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        started = False
+        try:
+            if previous is not None:
+                # Shielded: cancelling this update must not cancel its predecessor's marker
+                await asyncio.shield(previous)
+            async with self._workers:
+                self.waiting -= 1
+                self.running += 1
+                started = True
+                try:
+                    await coroutine
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                self.waiting -= 1
+                coroutine.close()
+            if done is not None:
+                done.set_result(None)
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    async def initialize(self):
+        self._workers = asyncio.Semaphore(self.max_workers)
+
+    async def shutdown(self):
+        pass
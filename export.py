@@ -0,0 +1,72 @@
+import csv
+import gzip
+import os
+from datetime import datetime, timezone
+
+from db import EXPORT_TABLES, iter_export_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # in requirements.txt; without it only csv export works
+    pa = pq = None
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Telegram's limit for bot document uploads
+TEXT_COLUMNS = {"post_link", "status", "reason", "note"}
+REAL_COLUMNS = {"slots"}
+
+
+def parse_day(value: str) -> int:
+    """YYYY-MM-DD (UTC) to epoch seconds; raises ValueError on anything else."""
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def write_csv_gz(path: str, table: str, start: int = None, end: int = None) -> int:
+    columns = EXPORT_TABLES[table][1]
+    count = 0
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in iter_export_chunks(table, start, end):
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _parquet_schema(columns):
+    return pa.schema([
+        (name, pa.string() if name in TEXT_COLUMNS else pa.float64() if name in REAL_COLUMNS else pa.int64())
+        for name in columns
+    ])
+
+
+def write_parquet(path: str, table: str, start: int = None, end: int = None) -> int:
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow, which isn't installed. Use csv instead.")
+    columns = EXPORT_TABLES[table][1]
+    schema = _parquet_schema(columns)
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in iter_export_chunks(table, start, end):
+            # One row group per chunk: columns are built from this chunk only
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema
+            ))
+            count += len(rows)
+        if not count:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+def export_table(directory: str, table: str, fmt: str = "csv", start: int = None,
+                 end: int = None) -> tuple[str, int]:
+    """Write `table` to a file in `directory`; returns (path, row count). Blocking, so run it
+    in a worker thread."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt == "parquet":
+        path = os.path.join(directory, f"{table}.parquet")
+        return path, write_parquet(path, table, start, end)
+    path = os.path.join(directory, f"{table}.csv.gz")
+    return path, write_csv_gz(path, table, start, end)
@@ -0,0 +1,81 @@
+import time
+from enum import IntFlag
+
+from db import load_user_flags, save_user_flags
+
+IDLE_EVICT_SECONDS = 15 * 60  # drop users from memory after this long without a touch
+
+
+class Flow(IntFlag):
+    """What the bot is waiting for from a user. Several can be set at once."""
+    NONE = 0
+    AWAITING_POST = 1
+    AWAITING_TWITTER = 2
+    AWAITING_F4F_JOIN = 4
+
+
+class FlowStateStore:
+    """Per-user conversation flags kept as one small int each instead of a user_data dict.
+
+    Loaded from SQLite on first touch, written back in batches by `flush()` and dropped from
+    memory by `evict_idle()`, so memory tracks active users only and in-progress flows
+    survive restarts.
+    """
+
+    def __init__(self, idle_seconds: int = IDLE_EVICT_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._flags = {}
+        self._touched = {}
+        self._dirty = set()
+
+    def get(self, user_id: int) -> Flow:
+        self._touched[user_id] = time.monotonic()
+        flags = self._flags.get(user_id)
+        if flags is None:
+            flags = self._flags[user_id] = load_user_flags(user_id)
+        return Flow(flags)
+
+    def has(self, user_id: int, flag: Flow) -> bool:
+        return bool(self.get(user_id) & flag)
+
+    def _store(self, user_id: int, flags: int):
+        if self._flags.get(user_id) != flags:
+            self._flags[user_id] = flags
+            self._dirty.add(user_id)
+
+    def set(self, user_id: int, flag: Flow):
+        self._store(user_id, self.get(user_id) | flag)
+
+    def clear(self, user_id: int, flag: Flow):
+        self._store(user_id, self.get(user_id) & ~flag)
+
+    def flush(self) -> int:
+        """Persist every changed user in one transaction. Returns how many were written."""
+        if not self._dirty:
+            return 0
+        rows = [(user_id, self._flags[user_id]) for user_id in self._dirty]
+        save_user_flags(rows)
+        self._dirty.clear()
+        return len(rows)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [user_id for user_id, touched in self._touched.items() if touched < cutoff]
+        if any(user_id in self._dirty for user_id in idle):
+            self.flush()
+        for user_id in idle:
+            del self._touched[user_id]
+            self._flags.pop(user_id, None)
+        return len(idle)
+
+    def __len__(self):
+        return len(self._flags)
+
+
+flows = FlowStateStore()
+
+
+async def persist_flow_state(context):
+    """Job: batch-write changed flow flags and forget idle users."""
+    flows.flush()
+    flows.evict_idle()
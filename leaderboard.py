@@ -0,0 +1,134 @@
+import time
+from collections import Counter
+
+from sortedcontainers import SortedList
+
+from db import (
+    get_confirmed_raid_totals, get_confirmed_raids_by_day, get_referral_totals, get_referrals_by_day,
+    get_task_slot_totals, get_task_slots_by_day
+)
+
+WINDOW_DAYS = 7
+BOARDS = ("raiders", "earners", "referrers")
+PERIODS = ("week", "all")
+
+
+def _today() -> int:
+    return int(time.time()) // 86400
+
+
+class RankedBoard:
+    """Per-user scores kept in rank order: top-N and a user's rank in O(log n)."""
+
+    def __init__(self):
+        self._scores = {}
+        self._ranked = SortedList()  # (-score, user_id), so rank 1 is index 0
+
+    def add(self, user_id: int, delta: float):
+        old = self._scores.get(user_id)
+        if old is not None:
+            self._ranked.remove((-old, user_id))
+        new = round((old or 0) + delta, 6)  # 0.1-slot rewards must not drift apart from ties
+        if new > 0:
+            self._scores[user_id] = new
+            self._ranked.add((-new, user_id))
+        else:
+            self._scores.pop(user_id, None)
+
+    def top(self, n: int) -> list[tuple[int, float]]:
+        return [(user_id, -neg) for neg, user_id in self._ranked.islice(0, n)]
+
+    def rank(self, user_id: int) -> tuple[int, float] | None:
+        """(1-based rank, score), or None if the user has no score."""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._ranked.index((-score, user_id)) + 1, score
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class WindowedBoard(RankedBoard):
+    """A RankedBoard over the last `days` days, built from per-day buckets.
+
+    Each day's contributions are kept in their own Counter; when a day falls out of the
+    window its bucket is subtracted, so the board never needs a rescan.
+    """
+
+    def __init__(self, days: int = WINDOW_DAYS):
+        super().__init__()
+        self.days = days
+        self._buckets = {}
+
+    def _expire(self, today: int):
+        for day in [d for d in self._buckets if d <= today - self.days]:
+            for user_id, amount in self._buckets.pop(day).items():
+                RankedBoard.add(self, user_id, -amount)
+
+    def add(self, user_id: int, delta: float, day: int = None):
+        today = _today()
+        day = today if day is None else day
+        self._expire(today)
+        if day <= today - self.days:
+            return
+        self._buckets.setdefault(day, Counter())[user_id] += delta
+        super().add(user_id, delta)
+
+    def top(self, n: int):
+        self._expire(_today())
+        return super().top(n)
+
+    def rank(self, user_id: int):
+        self._expire(_today())
+        return super().rank(user_id)
+
+
+class Leaderboards:
+    """Raiders (confirmed raids), earners (task slots) and referrers, all-time and 7-day.
+
+    Rebuilt from the DB at startup; afterwards bot.py feeds it each change right after the
+    DB call that made it.
+    """
+
+    def __init__(self):
+        self.boards = {}
+        self.reset()
+
+    def reset(self):
+        self.boards = {(name, "all"): RankedBoard() for name in BOARDS}
+        self.boards.update({(name, "week"): WindowedBoard() for name in BOARDS})
+
+    def rebuild(self):
+        self.reset()
+        since = (_today() - WINDOW_DAYS + 1) * 86400
+        seeds = {
+            "raiders": (get_confirmed_raid_totals, get_confirmed_raids_by_day),
+            "earners": (get_task_slot_totals, get_task_slots_by_day),
+            "referrers": (get_referral_totals, get_referrals_by_day),
+        }
+        for name, (totals, by_day) in seeds.items():
+            for user_id, score in totals():
+                self.boards[(name, "all")].add(user_id, score)
+            for day, user_id, score in by_day(since):
+                self.boards[(name, "week")].add(user_id, score, day=day)
+
+    def _record(self, name: str, user_id: int, amount: float):
+        self.boards[(name, "all")].add(user_id, amount)
+        self.boards[(name, "week")].add(user_id, amount)
+
+    def record_raid_confirmed(self, doer_id: int, reward: float):
+        self._record("raiders", doer_id, 1)
+        self._record("earners", doer_id, reward)
+
+    def record_referral(self, referrer_id: int):
+        self._record("referrers", referrer_id, 1)
+
+    def top(self, name: str, period: str, n: int = 10):
+        return self.boards[(name, period)].top(n)
+
+    def rank(self, name: str, period: str, user_id: int):
+        return self.boards[(name, period)].rank(user_id)
+
+
+leaderboards = Leaderboards()
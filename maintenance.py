@@ -0,0 +1,103 @@
+import time
+
+from db import (
+    analyze_db, checkpoint_wal, enable_incremental_vacuum, get_storage_stats, incremental_vacuum_step
+)
+
+MAINTENANCE_INTERVAL = 30 * 60  # seconds between scheduled runs
+STEP_BUDGET = 2.0  # seconds any one step may hold, or wait for, the database
+VACUUM_STEP_PAGES = 256  # pages per incremental_vacuum call; the lock is released between calls
+ANALYZE_EVERY = 24 * 3600  # full sampled ANALYZE; PRAGMA optimize in between
+QUIET_SECONDS = 120  # no incoming updates for this long counts as a quiet period
+
+_last_activity = 0.0
+_last_analyze = None
+
+
+async def note_activity(update, context):
+    """TypeHandler: remember when the bot last received an update."""
+    global _last_activity
+    _last_activity = time.monotonic()
+
+
+def is_quiet() -> bool:
+    return time.monotonic() - _last_activity >= QUIET_SECONDS
+
+
+def _vacuum(stats: dict, deadline: float) -> str:
+    # Converting needs a full VACUUM, which no time box fits; it's left to /maintenance vacuum
+    if stats["auto_vacuum"] != 2:  # 2 = INCREMENTAL
+        return "incremental auto-vacuum is off (use /maintenance vacuum to enable it)"
+    freed = 0
+    while stats["freelist_count"] > freed and time.monotonic() < deadline:
+        step = incremental_vacuum_step(VACUUM_STEP_PAGES, deadline)
+        if not step:
+            break
+        freed += step
+    return f"freed {freed} of {stats['freelist_count']} free page(s)"
+
+
+def _checkpoint(quiet: bool, deadline: float) -> str:
+    # PASSIVE never waits on readers or writers; TRUNCATE also resets the -wal file, so it
+    # only runs when nobody is using the bot
+    mode = "TRUNCATE" if quiet else "PASSIVE"
+    result = checkpoint_wal(mode, deadline)
+    if result is None:
+        return "not in WAL mode, nothing to checkpoint"
+    if result is False:
+        return f"{mode} ran out of time, retried next run"
+    busy, frames, done = result
+    return f"{mode}: {done}/{frames} frame(s) copied{' (busy)' if busy else ''}"
+
+
+def run_maintenance(step_budget: float = STEP_BUDGET, quiet: bool = None) -> dict:
+    """Statistics, incremental vacuum and a WAL checkpoint, each within `step_budget` seconds.
+    Returns a line per step for the report."""
+    global _last_analyze
+    quiet = is_quiet() if quiet is None else quiet
+    stats = get_storage_stats()
+    results = {}
+
+    full = (not stats["has_statistics"] or _last_analyze is None
+            or time.monotonic() - _last_analyze >= ANALYZE_EVERY)
+    if analyze_db(time.monotonic() + step_budget, full=full):
+        results["analyze"] = "full sampled ANALYZE" if full else "PRAGMA optimize"
+        if full:
+            _last_analyze = time.monotonic()
+    else:
+        results["analyze"] = "ran out of time, retried next run"
+
+    results["vacuum"] = _vacuum(stats, time.monotonic() + step_budget)
+    results["checkpoint"] = _checkpoint(quiet, time.monotonic() + step_budget)
+    return results
+
+
+def enable_vacuum_now() -> str:
+    """Admin-requested one-off conversion to incremental auto-vacuum, with no time box."""
+    if get_storage_stats()["auto_vacuum"] == 2:
+        return "Incremental auto-vacuum is already on."
+    enable_incremental_vacuum()
+    return "Incremental auto-vacuum enabled."
+
+
+def format_storage_report(results: dict = None) -> str:
+    stats = get_storage_stats()
+    mode = {0: "off", 1: "full", 2: "incremental"}.get(stats["auto_vacuum"], stats["auto_vacuum"])
+    lines = [
+        "🧹 Database maintenance\n",
+        f"💾 Main DB: {stats['db_bytes'] / 1e6:.1f} MB ({stats['page_count']} pages of {stats['page_size']} B)",
+        f"🕳 Free pages: {stats['freelist_count']} ({stats['free_bytes'] / 1e6:.1f} MB)",
+        f"📝 Journal: {stats['journal_mode']} · WAL file: {stats['wal_bytes'] / 1e6:.1f} MB",
+        f"🗃️ Archive DB: {stats['archive_bytes'] / 1e6:.1f} MB",
+        f"♻️ Auto-vacuum: {mode} · planner statistics: {'yes' if stats['has_statistics'] else 'no'}",
+    ]
+    if results:
+        lines.append("")
+        lines.extend(f"• {step}: {outcome}" for step, outcome in results.items())
+    return "\n".join(lines)
+
+
+def maintenance_job():
+    """Scheduler job: one time-boxed maintenance pass, logged."""
+    results = run_maintenance()
+    print("🧹 Maintenance: " + "; ".join(f"{step}: {outcome}" for step, outcome in results.items()))
@@ -0,0 +1,197 @@
+import functools
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+# ───── Callback Deduplication ────────────────────────────
+
+
+class TTLSet:
+    """Set of keys that forget themselves after `ttl` seconds; bounded to `max_size` entries."""
+
+    def __init__(self, ttl: float, max_size: int = 50_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expiry = OrderedDict()
+
+    def _purge(self, now: float):
+        while self._expiry:
+            key, expires = next(iter(self._expiry.items()))
+            if expires > now and len(self._expiry) <= self.max_size:
+                break
+            self._expiry.popitem(last=False)
+
+    def add(self, key) -> bool:
+        """Adds `key`; returns False if it was already present (i.e. a duplicate)."""
+        now = time.monotonic()
+        self._purge(now)
+        if key in self._expiry:
+            return False
+        self._expiry[key] = now + self.ttl
+        return True
+
+
+CALLBACK_DEDUP_WINDOW = 10  # seconds
+
+_seen_callbacks = TTLSet(CALLBACK_DEDUP_WINDOW)
+
+
+def idempotent_callback(handler):
+    """Drop repeated callback queries before they reach the handler (and the DB).
+
+    A query counts as a repeat if Telegram redelivers the same query ID, or if the same
+    user sends the same callback data again within the window (double taps). Handlers
+    still use conditional state transitions, so this is a cheap first line of defence.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if query:
+            fresh_id = _seen_callbacks.add(("id", query.id))
+            fresh_payload = _seen_callbacks.add(("data", query.from_user.id, query.data))
+            if not (fresh_id and fresh_payload):
+                try:
+                    await query.answer()
+                except Exception:
+                    pass
+                return
+        return await handler(update, context)
+
+    return wrapper
+
+
+# ───── Rate Limiting ─────────────────────────────────────
+
+# (burst capacity, tokens refilled per second). Keys are menu button texts, /command names
+# or callback data prefixes; "*" is the per-user budget shared by everything.
+RATE_LIMITS = {
+    "*": (20, 1.0),
+    "🔥 Ongoing Raids": (2, 1 / 30),
+    "ongoing_raids": (2, 1 / 30),
+    "📊 My Ongoing Raids": (2, 1 / 30),
+    "my_raids": (2, 1 / 30),
+    "🤝 Follow for Follow": (2, 1 / 30),
+    "responses": (3, 1 / 10),
+    "📊 Stats": (2, 1 / 60),
+}
+# Dropped first when the dispatcher backs up
+EXPENSIVE_COMMANDS = {
+    "🔥 Ongoing Raids", "ongoing_raids", "📊 My Ongoing Raids", "my_raids",
+    "🤝 Follow for Follow", "responses",
+}
+OVERLOAD_QUEUE_DEPTH = 200  # waiting updates before expensive work is shed
+SLOW_DOWN_NOTICE_INTERVAL = 30  # seconds between "slow down" replies to the same user
+MAX_TRACKED = 100_000  # buckets or notice times kept before idle ones are evicted
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, capacity: float, rate: float, now: float) -> bool:
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def command_key(update: Update) -> str | None:
+    """Which RATE_LIMITS entry an update belongs to."""
+    if update.callback_query and update.callback_query.data:
+        return update.callback_query.data.split("|", 1)[0]
+    if update.message and update.message.text:
+        text = update.message.text.strip()
+        if text.startswith("/"):
+            return text[1:].split(maxsplit=1)[0].split("@")[0] if len(text) > 1 else None
+        return text
+    return None
+
+
+class RateLimiter:
+    """Per-user and per-command token buckets plus overload shedding, run before all handlers.
+
+    Admins bypass every limit. Requests over budget are dropped with at most one cheap
+    "slow down" reply per SLOW_DOWN_NOTICE_INTERVAL; while the dispatcher queue is deeper
+    than OVERLOAD_QUEUE_DEPTH, expensive commands from regular users are shed outright.
+    """
+
+    def __init__(self, admins, limits=None, expensive=None, overload_depth: int = OVERLOAD_QUEUE_DEPTH):
+        self.admins = set(admins)
+        self.limits = limits or RATE_LIMITS
+        self.expensive = expensive if expensive is not None else EXPENSIVE_COMMANDS
+        self.overload_depth = overload_depth
+        self._buckets = {}
+        self._last_notice = {}
+        self.dropped = 0
+        self.shed = 0
+
+    def _allow(self, user_id: int, key: str, now: float) -> bool:
+        capacity, rate = self.limits[key]
+        bucket = self._buckets.get((user_id, key))
+        if bucket is None:
+            if len(self._buckets) > MAX_TRACKED:
+                self._evict(now)
+            bucket = self._buckets[(user_id, key)] = TokenBucket(capacity, now)
+        return bucket.take(capacity, rate, now)
+
+    def _evict(self, now: float):
+        """Forget buckets idle long enough to have refilled completely, and notice times
+        old enough that the next notice would be sent anyway."""
+        for bucket_key, bucket in list(self._buckets.items()):
+            capacity, rate = self.limits[bucket_key[1]]
+            if bucket.tokens + (now - bucket.updated) * rate >= capacity:
+                del self._buckets[bucket_key]
+        for user_id, noticed in list(self._last_notice.items()):
+            if now - noticed >= SLOW_DOWN_NOTICE_INTERVAL:
+                del self._last_notice[user_id]
+
+    def check(self, user_id: int, command: str | None, queue_depth: int = 0) -> str | None:
+        """Returns None to let the update through, otherwise "limited" or "shed"."""
+        if user_id in self.admins:
+            return None
+        now = time.monotonic()
+        if command in self.expensive and queue_depth > self.overload_depth:
+            self.shed += 1
+            return "shed"
+        if not self._allow(user_id, "*", now):
+            self.dropped += 1
+            return "limited"
+        if command in self.limits and not self._allow(user_id, command, now):
+            self.dropped += 1
+            return "limited"
+        return None
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """TypeHandler callback; register in a group before the real handlers."""
+        user = update.effective_user
+        if not user:
+            return
+        processor = context.application.update_processor
+        depth = getattr(processor, "queue_depth", 0)
+        verdict = self.check(user.id, command_key(update), depth)
+        if verdict is None:
+            return
+
+        now = time.monotonic()
+        notify = now - self._last_notice.get(user.id, 0) >= SLOW_DOWN_NOTICE_INTERVAL
+        if notify:
+            if len(self._last_notice) > MAX_TRACKED:
+                self._evict(now)
+            self._last_notice[user.id] = now
+        text = "🐢 Slow down a little and try again in a moment." if verdict == "limited" \
+            else "⏳ The bot is busy right now, please try again in a minute."
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text if notify else None)
+            elif notify and update.effective_message and update.effective_chat.type == "private":
+                await update.effective_message.reply_text(text)
+        except Exception as e:
+            print(f"❌ Failed to send slow-down notice to {user.id}: {e}")
+        raise ApplicationHandlerStop
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import timedelta
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from db import (
+    clear_chat_unreachable, get_due_notifications, get_unreachable_chat_ids, mark_chat_unreachable,
+    mark_notification_failed, mark_notifications_sent
+)
+
+# Telegram allows roughly 30 messages/second across all chats for a bot
+MAX_PER_SECOND = 25
+OUTBOX_BATCH_SIZE = 50  # outbox rows claimed per drain pass
+
+
+def retry_delay(error: RetryAfter) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+# ───── Unreachable Chats ─────────────────────────────────
+# Mirrors the unreachable_chats table in memory so skipping a dead chat costs no I/O.
+# The bot is the only process that sends, so the mirror stays in step with the table.
+
+_unreachable = None
+
+
+def _unreachable_ids() -> set[int]:
+    global _unreachable
+    if _unreachable is None:
+        _unreachable = get_unreachable_chat_ids()
+    return _unreachable
+
+
+def is_unreachable(chat_id: int) -> bool:
+    return chat_id in _unreachable_ids()
+
+
+def note_send_error(chat_id: int, error: Exception) -> bool:
+    """Record `chat_id` as unreachable if `error` says so; returns True if it did."""
+    if isinstance(error, Forbidden) or (
+            isinstance(error, BadRequest) and "chat not found" in str(error).lower()):
+        _unreachable_ids().add(chat_id)
+        mark_chat_unreachable(chat_id, str(error))
+        return True
+    return False
+
+
+async def clear_unreachable_on_activity(update, context):
+    """TypeHandler callback: a user who talks to the bot again can be messaged again."""
+    user = update.effective_user
+    if user and user.id in _unreachable_ids():
+        _unreachable_ids().discard(user.id)
+        clear_chat_unreachable(user.id)
+
+
+async def safe_send(bot, chat_id: int, text: str, **kwargs):
+    """send_message to someone other than the current user.
+
+    Known-unreachable chats are skipped without an API call and new ones are recorded.
+    Errors are logged, never raised. Returns the sent Message or None.
+    """
+    if is_unreachable(chat_id):
+        return None
+    try:
+        return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+    except Exception as e:
+        if not note_send_error(chat_id, e):
+            print(f"❌ Failed to notify {chat_id}: {e}")
+        return None
+
+
+async def fan_out(bot, messages, per_second: int = MAX_PER_SECOND):
+    """Send many messages paced under Telegram's global rate limit.
+
+    `messages` is an iterable of (chat_id, text) pairs or (chat_id, text, kwargs) triples.
+    Failures are logged and skipped so one blocked user can't stop the batch; known
+    unreachable chats are skipped outright. Returns the number of messages delivered.
+    """
+    interval = 1 / per_second
+    sent = 0
+    for message in messages:
+        chat_id, text = message[0], message[1]
+        kwargs = message[2] if len(message) > 2 else {}
+        if is_unreachable(chat_id):
+            continue
+        for attempt in range(2):
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                sent += 1
+                break
+            except RetryAfter as e:
+                # Flood control: wait it out once, then give up on this message
+                await asyncio.sleep(retry_delay(e))
+            except Exception as e:
+                if not note_send_error(chat_id, e):
+                    print(f"❌ Failed to notify {chat_id}: {e}")
+                break
+        await asyncio.sleep(interval)
+    return sent
+
+
+async def drain_outbox(bot, per_second: int = MAX_PER_SECOND, batch_size: int = OUTBOX_BATCH_SIZE):
+    """Deliver queued outbox notifications, paced like fan_out.
+
+    Transient failures are retried later with backoff; a blocked bot or a bad request is
+    final. Sent rows are marked in one write per batch. Returns the number delivered.
+    """
+    interval = 1 / per_second
+    sent_ids = []
+    try:
+        for row_id, chat_id, text, parse_mode, reply_markup, attempts in get_due_notifications(batch_size):
+            if is_unreachable(chat_id):
+                mark_notification_failed(row_id, "unreachable", final=True)
+                continue
+            kwargs = {}
+            if parse_mode:
+                kwargs["parse_mode"] = parse_mode
+            if reply_markup:
+                kwargs["reply_markup"] = InlineKeyboardMarkup.de_json(reply_markup, bot)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                sent_ids.append(row_id)
+            except RetryAfter as e:
+                # Flood control applies to the whole bot: push this one back and stop the pass
+                mark_notification_failed(row_id, str(e), retry_in=int(retry_delay(e)) + 1)
+                break
+            except (Forbidden, BadRequest) as e:
+                note_send_error(chat_id, e)
+                mark_notification_failed(row_id, str(e), final=True)
+            except Exception as e:
+                print(f"❌ Outbox delivery to {chat_id} failed (attempt {attempts + 1}): {e}")
+                mark_notification_failed(row_id, str(e))
+            await asyncio.sleep(interval)
+    finally:
+        if sent_ids:
+            mark_notifications_sent(sent_ids)
+    return len(sent_ids)
+
+
+async def outbox_job(context):
+    """Job: drain the notification outbox."""
+    await drain_outbox(context.bot)
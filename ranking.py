@@ -0,0 +1,102 @@
+from sortedcontainers import SortedList
+
+from db import RAID_DURATION, get_live_completed_post_ids, get_live_raids, now_ts
+
+FEED_SIZE = 10  # raids shown per 🔥 Ongoing Raids request
+RANK_REFRESH_SECONDS = 60  # full rescore interval; picks up approvals made outside the bot
+NEED_WEIGHT = 1.0  # favours raids with few completions so far
+URGENCY_WEIGHT = 0.5  # favours raids close to expiry
+
+
+class LiveRaid:
+    __slots__ = ("post_id", "link", "owner_name", "owner_id", "group_id", "expires_at",
+                 "completions", "key")
+
+    def __init__(self, post_id, link, owner_name, owner_id, group_id, expires_at, completions):
+        self.post_id = post_id
+        self.link = link
+        self.owner_name = owner_name
+        self.owner_id = owner_id
+        self.group_id = group_id
+        self.expires_at = expires_at
+        self.completions = completions
+        self.key = None
+
+
+def raid_score(completions: int, expires_at: int, now: int) -> float:
+    """Higher is shown first: raids that have had little engagement and are running out of time."""
+    remaining = min(max(expires_at - now, 0), RAID_DURATION)
+    urgency = 1 - remaining / RAID_DURATION
+    need = 1 / (1 + completions)
+    return NEED_WEIGHT * need + URGENCY_WEIGHT * urgency
+
+
+class RaidFeed:
+    """Live raids kept in score order so each request walks only the top of the list.
+
+    Scores are computed against the time of the last rebuild and refreshed every
+    RANK_REFRESH_SECONDS; a completion re-keys just its own raid. Personalising a feed
+    only skips raids the viewer owns or has already joined, so nothing is sorted per request.
+    """
+
+    def __init__(self):
+        self._raids = {}
+        self._order = SortedList()  # (-score, post_id)
+        self._scored_at = 0
+        self._stale = True
+
+    def rebuild(self):
+        now = now_ts()
+        self._raids = {row[0]: LiveRaid(*row) for row in get_live_raids()}
+        self._order = SortedList()
+        for raid in self._raids.values():
+            self._insert(raid, now)
+        self._scored_at = now
+        self._stale = False
+
+    def _insert(self, raid: LiveRaid, now: int):
+        raid.key = (-raid_score(raid.completions, raid.expires_at, now), raid.post_id)
+        self._order.add(raid.key)
+
+    def _ensure_fresh(self):
+        if self._stale or now_ts() - self._scored_at >= RANK_REFRESH_SECONDS:
+            self.rebuild()
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after posts were approved."""
+        self._stale = True
+
+    def record_completion(self, post_id: int):
+        raid = self._raids.get(post_id)
+        if raid is None:
+            return
+        self._order.remove(raid.key)
+        raid.completions += 1
+        self._insert(raid, self._scored_at)
+
+    def top_for(self, user_id: int, group_id: int = None, k: int = FEED_SIZE) -> list[LiveRaid]:
+        """The viewer's best k live raids: not their own and not already joined."""
+        self._ensure_fresh()
+        joined = get_live_completed_post_ids(user_id)
+        now = now_ts()
+        picked = []
+        for _, post_id in self._order:
+            raid = self._raids[post_id]
+            if (raid.expires_at <= now or raid.owner_id == user_id or post_id in joined
+                    or (group_id and raid.group_id != group_id)):
+                continue
+            picked.append(raid)
+            if len(picked) == k:
+                break
+        return picked
+
+    def live_count(self, group_id: int = None) -> int:
+        self._ensure_fresh()
+        now = now_ts()
+        return sum(
+            1 for raid in self._raids.values()
+            if raid.expires_at > now and (not group_id or raid.group_id == group_id)
+        )
+
+
+feed = RaidFeed()
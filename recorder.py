@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+PSEUDONYM_OFFSET = 10_000_000  # fake IDs start here, clear of post IDs and other small numbers
+PII_KEYS = ("first_name", "last_name", "username", "phone_number", "bio")
+# Objects whose "id" is a user or chat ID, and fields that always hold one, whatever its size.
+# Message, post and update IDs live under other names and are kept as they are.
+ID_OBJECT_KEYS = (
+    "from", "chat", "user", "sender_chat", "sender_user", "forward_from", "forward_from_chat",
+    "via_bot", "new_chat_members", "new_chat_member", "old_chat_member", "left_chat_member"
+)
+ID_KEYS = ("user_id", "chat_id", "sender_chat_id", "migrate_to_chat_id", "migrate_from_chat_id")
+# Callback data prefix -> "|"-separated positions holding a user ID
+CALLBACK_USER_FIELDS = {
+    "approve": (2,), "reject": (2,), "vconfirm": (2,), "vreject": (2,),
+    "followback": (1,), "ignorefollow": (1,), "ignore_follow": (1,), "followdone": (1,),
+}
+START_ARG = re.compile(r"^(/start(?:@\w+)?\s+)(\d+)$")
+
+
+class UpdateRecorder:
+    """Appends anonymised incoming updates to a JSONL file for later replay.
+
+    Every line is {"ts": <unix seconds>, "update": <Update.to_dict()>}. User and
+    chat IDs are replaced by a keyed hash so the same person keeps the same
+    pseudonym across the whole recording (including inside callback data and
+    /start referral arguments), and names/usernames are dropped. IDs are found by
+    field name, never by size: old accounts have small IDs too. Twitter handles in
+    confirm_twitter callbacks are pseudonymised the same way.
+    """
+
+    def __init__(self, path: str, salt: str | None = None):
+        self.path = path
+        self.salt = (salt or os.urandom(16).hex()).encode()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _digest(self, value: str) -> int:
+        digest = hmac.new(self.salt, value.encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], "big") % 10**12
+
+    def pseudonym(self, value: int) -> int:
+        fake = PSEUDONYM_OFFSET + self._digest(str(abs(value)))
+        return -fake if value < 0 else fake
+
+    def _scrub(self, obj, parent: str = None):
+        if isinstance(obj, dict):
+            out = {}
+            for key, value in obj.items():
+                if key in PII_KEYS:
+                    out[key] = f"user{self.pseudonym(obj['id'])}" if key == "first_name" and "id" in obj else None
+                elif isinstance(value, int) and (key in ID_KEYS or key == "id" and parent in ID_OBJECT_KEYS):
+                    out[key] = self.pseudonym(value)
+                elif key == "data" and isinstance(value, str):
+                    out[key] = self._scrub_callback_data(value)
+                elif key == "text" and isinstance(value, str):
+                    match = START_ARG.match(value)
+                    out[key] = f"{match.group(1)}{self.pseudonym(int(match.group(2)))}" if match else value
+                else:
+                    out[key] = self._scrub(value, key)
+            return {k: v for k, v in out.items() if v is not None}
+        if isinstance(obj, list):
+            return [self._scrub(item, parent) for item in obj]
+        return obj
+
+    def _scrub_callback_data(self, data: str) -> str:
+        parts = data.split("|")
+        if parts[0] == "confirm_twitter" and len(parts) > 1:
+            parts[1] = f"h{self._digest(parts[1].lower())}"
+        for i in CALLBACK_USER_FIELDS.get(parts[0], ()):
+            if i < len(parts) and parts[i].lstrip("-").isdigit():
+                parts[i] = str(self.pseudonym(int(parts[i])))
+        return "|".join(parts)
+
+    def record(self, update: Update):
+        line = json.dumps(
+            {"ts": time.time(), "update": self._scrub(update.to_dict())},
+            ensure_ascii=False
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """TypeHandler callback; register in a group that runs before the real handlers."""
+        try:
+            self.record(update)
+        except Exception as e:
+            print(f"❌ Failed to record update: {e}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_recording(path: str):
+    """Yields (ts, update_dict) pairs from a recording, in file order."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                yield entry["ts"], entry["update"]
@@ -0,0 +1,273 @@
+"""Replay a recorded update stream against a fake local Bot API.
+
+Usage:
+    python replay.py updates.jsonl                 # original speed
+    python replay.py updates.jsonl --speed 10      # 10x faster
+    python replay.py updates.jsonl --speed 0       # flat out
+
+Recordings come from setting UPDATE_RECORD_FILE on the live bot (see recorder.py).
+The run happens against a fresh shared in-memory database unless --db is given.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from telegram import Update
+
+import bot
+import db
+from recorder import load_recording
+
+FAKE_TOKEN = "123456:REPLAY"
+FAKE_BOT = {"id": 123456, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+
+
+# ───── Fake Bot API ──────────────────────────────────────
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Answers every Bot API method with a plausible success payload."""
+
+    calls = {}
+    calls_lock = threading.Lock()
+    message_id = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _params(self) -> dict:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        ctype = self.headers.get("Content-Type", "")
+        if ctype.startswith("multipart/"):
+            # Only chat_id matters for building the reply; skip full multipart parsing
+            match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body)
+            return {"chat_id": match.group(1).decode()} if match else {}
+        if ctype.startswith("application/json"):
+            return json.loads(body or b"{}")
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        params = self._params()
+        with FakeBotAPI.calls_lock:
+            FakeBotAPI.calls[method] = FakeBotAPI.calls.get(method, 0) + 1
+            FakeBotAPI.message_id += 1
+            message_id = FakeBotAPI.message_id
+
+        chat_id = str(params.get("chat_id", ""))
+        chat_id = int(chat_id) if chat_id.lstrip("-").isdigit() else -1
+        if method == "getMe":
+            result = FAKE_BOT
+        elif method == "getChatMember":
+            result = {
+                "status": "member",
+                "user": {"id": int(params.get("user_id", 1)), "is_bot": False, "first_name": "Raider"}
+            }
+        elif method.startswith(("send", "edit", "copy", "forward")):
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": FAKE_BOT,
+                "text": params.get("text", "")
+            }
+        else:
+            result = True
+
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_fake_api() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ───── Instrumentation ───────────────────────────────────
+
+
+class Stats:
+    def __init__(self):
+        self.handler_ms = []
+        self.queue_ms = []
+        self.db_ms = []
+        self.db_locked = 0
+        self.errors = 0
+        self.dispatcher = None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def instrument_db(stats: Stats):
+    """Wrap every db.py function to time DB work and count lock errors, wherever it's bound.
+
+    Modules that did `from db import ...` hold their own references, so every loaded module
+    is patched. A returned generator (the iter_* functions) is timed across its iteration,
+    where its page queries run, and counts as one call once it's exhausted or closed. Only
+    the outermost db call on a thread is recorded, so db functions calling each other aren't
+    counted twice.
+    """
+    depth = threading.local()
+
+    def run(func, *args, **kwargs):
+        depth.value = getattr(depth, "value", 0) + 1
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) and depth.value == 1:
+                stats.db_locked += 1
+            raise
+        finally:
+            depth.value -= 1
+
+    def timed_iteration(gen):
+        spent = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = run(next, gen)
+                except StopIteration:
+                    return
+                finally:
+                    spent += time.perf_counter() - started
+                yield item
+        finally:
+            gen.close()
+            stats.db_ms.append(spent * 1000)
+
+    def wrap(func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            outermost = getattr(depth, "value", 0) == 0
+            started = time.perf_counter()
+            result = run(func, *args, **kwargs)
+            if outermost and inspect.isgenerator(result):
+                return timed_iteration(result)
+            if outermost:
+                stats.db_ms.append((time.perf_counter() - started) * 1000)
+            return result
+        return timed
+
+    wrapped = {
+        id(func): (func, wrap(func))
+        for name, func in inspect.getmembers(db, inspect.isfunction)
+        if func.__module__ == db.__name__ and name not in ("connect", "configure_db", "init_db")
+    }
+    for module in list(sys.modules.values()):
+        for attr, value in list(getattr(module, "__dict__", {}).items()):
+            func, timed = wrapped.get(id(value), (None, None))
+            if value is func:
+                setattr(module, attr, timed)
+
+
+# ───── Replay ────────────────────────────────────────────
+
+
+async def replay(path: str, speed: float, stats: Stats) -> tuple[int, float]:
+    server = start_fake_api()
+    base_url = f"http://127.0.0.1:{server.server_port}/bot"
+    app = bot.build_application(token=FAKE_TOKEN, base_url=base_url)
+
+    async def on_error(update, context):
+        stats.errors += 1
+
+    app.add_error_handler(on_error)
+
+    async def timed(update: Update, queued_at: float):
+        started = time.perf_counter()
+        stats.queue_ms.append((started - queued_at) * 1000)
+        await app.process_update(update)
+        stats.handler_ms.append((time.perf_counter() - started) * 1000)
+
+    await app.initialize()
+    await app.start()
+    tasks = []
+    count = 0
+    wall_start = time.perf_counter()
+    first_ts = None
+    try:
+        for ts, data in load_recording(path):
+            if first_ts is None:
+                first_ts = ts
+            if speed > 0:
+                delay = (ts - first_ts) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            update = Update.de_json(data, app.bot)
+            queued_at = time.perf_counter()
+            tasks.append(asyncio.create_task(
+                app.update_processor.process_update(update, timed(update, queued_at))
+            ))
+            count += 1
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if hasattr(app.update_processor, "stats"):
+            stats.dispatcher = app.update_processor.stats()
+    finally:
+        elapsed = time.perf_counter() - wall_start
+        await app.stop()  # also waits for background tasks such as notification fan-outs
+        await app.shutdown()
+        if app.post_shutdown:  # run_polling() would call this in production
+            await app.post_shutdown(app)
+        server.shutdown()
+    return count, elapsed
+
+
+def print_report(count: int, elapsed: float, stats: Stats):
+    print(f"📼 Replayed {count} update(s) in {elapsed:.2f}s "
+          f"({count / elapsed if elapsed else 0:.1f} updates/s)")
+    print(f"⏱️ Handler latency: p50 {percentile(stats.handler_ms, 50):.1f}ms, "
+          f"p99 {percentile(stats.handler_ms, 99):.1f}ms")
+    print(f"🚦 Queue wait: p50 {percentile(stats.queue_ms, 50):.1f}ms, "
+          f"p99 {percentile(stats.queue_ms, 99):.1f}ms")
+    db_total = sum(stats.db_ms) / 1000
+    print(f"🗄️ DB: {len(stats.db_ms)} call(s), {db_total:.2f}s total "
+          f"({db_total / elapsed * 100 if elapsed else 0:.0f}% of wall time), "
+          f"p99 {percentile(stats.db_ms, 99):.1f}ms, {stats.db_locked} lock error(s)")
+    print(f"❌ Handler errors: {stats.errors}")
+    print(f"📡 Bot API calls: {dict(sorted(FakeBotAPI.calls.items()))}")
+    if stats.dispatcher:
+        print(f"📬 Dispatcher: {stats.dispatcher}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded update stream for load testing.")
+    parser.add_argument("recording", help="JSONL file written by the update recorder")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = original timing, N = N× faster, 0 = as fast as possible")
+    parser.add_argument("--db", default=":memory:",
+                        help="Database to run against: path, tmpfs path or :memory: (default)")
+    args = parser.parse_args()
+
+    db.configure_db(args.db)
+    db.init_db()
+
+    stats = Stats()
+    instrument_db(stats)
+    count, elapsed = asyncio.run(replay(args.recording, args.speed, stats))
+    print_report(count, elapsed, stats)
+
+
+if __name__ == "__main__":
+    main()